@@ -0,0 +1,34 @@
+import argparse
+import json
+
+
+# Print per-route changes between two benchmark result files
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--metric", default="p95_ms")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = {run["dataset"]["name"]: run for run in json.load(file)["runs"]}
+    with open(args.candidate) as file:
+        candidate = {run["dataset"]["name"]: run for run in json.load(file)["runs"]}
+
+    for name in [name for name in baseline if name in candidate]:
+        print(f"{name} dataset, {args.metric}:")
+        old_routes = baseline[name]["routes"]
+        new_routes = candidate[name]["routes"]
+
+        for route in [route for route in old_routes if route in new_routes]:
+            old = old_routes[route][args.metric]
+            new = new_routes[route][args.metric]
+            change = (new - old) / old * 100 if old else 0.0
+            print(
+                f"  {route:20} {old:10.2f} -> {new:10.2f}  ({change:+6.1f}%)  "
+                f"queries {old_routes[route]['queries']} -> {new_routes[route]['queries']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import random
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from werkzeug.security import generate_password_hash
+
+from faqapp.content import content_columns
+from faqapp.counts import repair_note_counts
+from faqapp.extensions import db
+from faqapp.hierarchy import ROOT_CATEGORY_KEY, next_root_key_value
+from faqapp.models import Note, User, Category, parent_tree, tree_keys, tree_segment
+from faqapp.versions import CATEGORY_VERSION, NOTE_VERSION, bump_version, set_version
+
+# Password shared by all generated users
+PASSWORD = "bench"
+
+WORDS = (
+    "printer scanner barcode register fiscal driver reset firmware update "
+    "network cable port power settings menu paper receipt label tax report "
+    "install configure restart error code battery charger display keyboard "
+    "server backup database login password account license terminal"
+).split()
+
+
+class Dataset(NamedTuple):
+    name: str
+    users: int
+    categories: int
+    notes: int
+    # Most children a category can get, and deepest level generated
+    max_children: int
+    max_depth: int
+
+
+DATASETS = {
+    "small": Dataset("small", 20, 50, 1_000, 8, 3),
+    "medium": Dataset("medium", 100, 300, 10_000, 15, 4),
+    "large": Dataset("large", 500, 1_500, 100_000, 40, 5),
+}
+
+
+# Fill an empty database (General category and admin already created)
+# with a reproducible dataset. Rows are inserted in bulk.
+def generate(dataset, seed=0):
+    rng = random.Random(seed)
+
+    generate_users(rng, dataset.users)
+    category_ids = generate_categories(rng, dataset)
+    generate_notes(rng, dataset.notes, category_ids)
+    # Counted once at the end instead of per batch
+    repair_note_counts()
+
+    bump_version(CATEGORY_VERSION)
+    bump_version(NOTE_VERSION)
+    db.session.commit()
+
+
+# Users spread over permission levels, most of them readers
+def generate_users(rng, count):
+    password_hash = generate_password_hash(PASSWORD)
+    db.session.execute(
+        db.insert(User),
+        [
+            {
+                "name": f"user{i}",
+                "hash": password_hash,
+                "permission_level": rng.choices((1, 2, 3, 4), (60, 25, 12, 3))[0],
+            }
+            for i in range(count)
+        ],
+    )
+
+
+# Category tree mixing wide and deep branches
+def generate_categories(rng, dataset):
+    rows = []
+    # Next free child key for each tree, top level continues after General
+    next_key = {"": next_root_key_value()}
+    open_parents = [""]
+
+    while len(rows) < dataset.categories and open_parents:
+        parent = rng.choice(open_parents)
+        key = next_key.setdefault(parent, 1)
+        level = len(tree_keys(parent))
+
+        if key > dataset.max_children or level >= dataset.max_depth:
+            open_parents.remove(parent)
+            continue
+
+        next_key[parent] = key + 1
+        tree = parent + tree_segment(key)
+        rows.append(
+            {
+                "name": f"Category {len(rows) + 1}",
+                "level": level,
+                "tree": tree,
+                "subcategory_count": 0,
+            }
+        )
+        open_parents.append(tree)
+
+    counts = {}
+    for row in rows:
+        if row["level"] > 0:
+            parent = parent_tree(row["tree"])
+            counts[parent] = counts.get(parent, 0) + 1
+    for row in rows:
+        row["subcategory_count"] = counts.get(row["tree"], 0)
+        row["next_child_key"] = next_key.get(row["tree"], 1)
+
+    db.session.execute(db.insert(Category), rows)
+    set_version(ROOT_CATEGORY_KEY, next_key[""])
+
+    return db.session.execute(db.select(Category.id)).scalars().all()
+
+
+# Notes with log-normally distributed content sizes, from a line to a few pages
+def generate_notes(rng, count, category_ids, batch_size=5000):
+    author_ids = db.session.execute(
+        db.select(User.id).where(User.permission_level > 1)
+    ).scalars().all()
+    start = datetime(2020, 1, 1)
+
+    for offset in range(0, count, batch_size):
+        rows = []
+        for i in range(offset, min(offset + batch_size, count)):
+            created = start + timedelta(minutes=rng.randrange(60 * 24 * 365 * 4))
+            size = min(int(rng.lognormvariate(6.5, 1.0)), 20_000)
+            rows.append(
+                {
+                    "title": " ".join(rng.choices(WORDS, k=rng.randint(2, 8))).capitalize(),
+                    **content_columns(random_text(rng, size)),
+                    "category": rng.choice(category_ids),
+                    "author_id": rng.choice(author_ids),
+                    "create_date": created,
+                    "update_date": created,
+                }
+            )
+        db.session.execute(db.insert(Note), rows)
+
+
+def random_text(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+        if rng.random() < 0.08:
+            words.append("\n")
+    return " ".join(words)[:size]
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import String, event, type_coerce
+
+from benchmarks.datagen import DATASETS, generate
+from config import Config
+from faqapp import create_app
+from faqapp.categories import get_category_tree
+from faqapp.extensions import db
+from faqapp.models import Note
+from faqapp.pagination import encode_cursor
+from faqapp.typeahead import get_typeahead_index
+
+
+# Routes driven by the benchmark: name, method and a function building
+# the request from the dataset's sample ids
+def routes(sample):
+    note_id = sample["note_id"]
+    category_id = sample["category_id"]
+    return [
+        ("index", "GET", lambda: "/", None),
+        ("index_page_2", "GET", lambda: f"/?after={sample['cursor']}", None),
+        ("notes_by_category", "GET", lambda: f"/cat/{category_id}", None),
+        ("notes_by_subtree", "GET", lambda: f"/cat/{sample['root_id']}?subtree=1", None),
+        ("search", "GET", lambda: "/search/?q=printer+reset", None),
+        ("manage_categories", "GET", lambda: "/cat/manage", None),
+        ("add_note_form", "GET", lambda: "/add", None),
+        ("update_note_form", "GET", lambda: f"/{note_id}/update", None),
+        ("manage_users", "GET", lambda: "/users/manage", None),
+        ("api_notes", "GET", lambda: "/api/notes", None),
+        ("api_note", "GET", lambda: f"/api/notes/{note_id}", None),
+        ("api_categories", "GET", lambda: "/api/categories", None),
+        ("typeahead", "GET", lambda: "/api/typeahead?q=print", None),
+        (
+            "add_note",
+            "POST",
+            lambda: "/add",
+            {"title": "Benchmark note", "note_content": "text", "cat_selection": "1"},
+        ),
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+# Benchmark every route against one generated dataset
+def run_dataset(dataset, iterations, warmup, seed):
+    directory = tempfile.mkdtemp(prefix="faqapp-bench-")
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(directory, "bench.db")
+        TESTING = True
+
+    app = create_app(BenchConfig)
+
+    started = time.perf_counter()
+    with app.app_context():
+        generate(dataset, seed)
+        sample = pick_sample()
+        # Index the generated titles now, as a worker would at startup
+        get_typeahead_index().refresh()
+    generate_seconds = time.perf_counter() - started
+
+    queries = []
+    with app.app_context():
+        event.listen(
+            db.engine, "before_cursor_execute", lambda *args: queries.append(args[2])
+        )
+
+    client = app.test_client()
+    client.post("/auth/login", data={"username": "admin", "password": "admin"})
+
+    results = {}
+    for name, method, url, data in routes(sample):
+        for _ in range(warmup):
+            client.open(url(), method=method, data=data)
+
+        timings = []
+        query_counts = []
+        status = None
+        for _ in range(iterations):
+            queries.clear()
+            started = time.perf_counter()
+            response = client.open(url(), method=method, data=data)
+            response.get_data()
+            timings.append(time.perf_counter() - started)
+            query_counts.append(len(queries))
+            status = response.status_code
+
+        total = sum(timings)
+        results[name] = {
+            "status": status,
+            "iterations": iterations,
+            "p50_ms": percentile(timings, 0.50) * 1000,
+            "p95_ms": percentile(timings, 0.95) * 1000,
+            "p99_ms": percentile(timings, 0.99) * 1000,
+            "mean_ms": statistics.fmean(timings) * 1000,
+            "throughput_rps": iterations / total if total else None,
+            "queries": statistics.median(query_counts),
+        }
+
+    return {
+        "dataset": dataset._asdict(),
+        "generate_seconds": generate_seconds,
+        "routes": results,
+    }
+
+
+# Ids used to build URLs: a busy category, a top level category and a note
+def pick_sample():
+    category_tree = get_category_tree()
+    busiest = db.session.execute(
+        db.select(Note.category)
+        .group_by(Note.category)
+        .order_by(db.func.count().desc())
+    ).scalar()
+    root = max(category_tree.roots, key=lambda c: c.subcategory_count)
+    note = db.session.execute(
+        db.select(Note.id, type_coerce(Note.create_date, String).label("raw_date"))
+        .order_by(Note.create_date, Note.id)
+    ).first()
+
+    return {
+        "note_id": note.id,
+        "category_id": busiest,
+        "root_id": root.id,
+        "cursor": encode_cursor(note.raw_date, note.id),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark faqapp routes.")
+    parser.add_argument(
+        "--sizes",
+        default="small,medium",
+        help=f"Comma separated datasets: {', '.join(DATASETS)}",
+    )
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_output.json")
+    args = parser.parse_args()
+
+    runs = []
+    for size in args.sizes.split(","):
+        dataset = DATASETS[size.strip()]
+        print(f"Running {dataset.name} dataset ({dataset.notes} notes)...")
+        run = run_dataset(dataset, args.iterations, args.warmup, args.seed)
+        runs.append(run)
+
+        for name, result in run["routes"].items():
+            print(
+                f"  {name:20} p50 {result['p50_ms']:8.2f} ms  "
+                f"p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+                f"{result['throughput_rps']:8.1f} req/s  {result['queries']:4} queries"
+            )
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "seed": args.seed,
+        "iterations": args.iterations,
+        "runs": runs,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
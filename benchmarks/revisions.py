@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import func
+
+from benchmarks.datagen import WORDS, random_text
+from benchmarks.harness import percentile
+from config import Config
+from faqapp import create_app
+from faqapp.extensions import db
+from faqapp.models import Note, NoteRevision
+from faqapp.revisions import rebuild_revisions, record_revision
+
+
+# Typical edit of a procedure: a few lines changed, added or removed
+def edit(rng, content):
+    lines = content.split("\n")
+    for _ in range(rng.randint(1, 3)):
+        action = rng.random()
+        position = rng.randrange(len(lines) + 1)
+        if action < 0.5 and lines:
+            lines[min(position, len(lines) - 1)] = random_text(rng, rng.randint(20, 120))
+        elif action < 0.8:
+            lines.insert(position, " ".join(rng.choices(WORDS, k=rng.randint(3, 15))))
+        elif len(lines) > 1:
+            lines.pop(min(position, len(lines) - 1))
+    return "\n".join(lines)
+
+
+# Edit one note many times with the given snapshot interval, then measure
+# the stored size and the time to rebuild randomly chosen revisions
+def run_interval(interval, revisions, size, rebuilds, seed):
+    directory = tempfile.mkdtemp(prefix="faqapp-bench-")
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(directory, "bench.db")
+        REVISION_SNAPSHOT_INTERVAL = interval
+        TESTING = True
+
+    app = create_app(BenchConfig)
+    rng = random.Random(seed)
+
+    with app.app_context():
+        note = Note(
+            title="Benchmark note",
+            content=random_text(rng, size),
+            category=1,
+            author_id=1,
+        )
+        db.session.add(note)
+        db.session.commit()
+
+        started = time.perf_counter()
+        for number in range(revisions):
+            content = edit(rng, note.content)
+            record_revision(note, note.title, content, 1)
+            note.content = content
+            db.session.commit()
+        record_seconds = time.perf_counter() - started
+
+        stored, full, count = db.session.execute(
+            db.select(
+                func.sum(func.length(NoteRevision.data)),
+                func.sum(NoteRevision.content_size),
+                func.count(),
+            ).where(NoteRevision.note_id == note.id)
+        ).one()
+
+        timings = []
+        for _ in range(rebuilds):
+            number = rng.randint(1, count)
+            started = time.perf_counter()
+            rebuild_revisions(note.id, number)
+            timings.append(time.perf_counter() - started)
+
+    return {
+        "snapshot_interval": interval,
+        "revisions": count,
+        "stored_bytes_per_revision": stored / count,
+        "full_copy_bytes_per_revision": full / count,
+        "compression_ratio": full / stored,
+        "record_ms": record_seconds / revisions * 1000,
+        "rebuild_p50_ms": percentile(timings, 0.50) * 1000,
+        "rebuild_p95_ms": percentile(timings, 0.95) * 1000,
+        "rebuild_mean_ms": statistics.fmean(timings) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark note revision storage.")
+    parser.add_argument(
+        "--intervals",
+        default="1,10,20,50",
+        help="Comma separated snapshot intervals to compare.",
+    )
+    parser.add_argument("--revisions", type=int, default=200)
+    parser.add_argument("--size", type=int, default=4000, help="Note size in characters.")
+    parser.add_argument("--rebuilds", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = []
+    for interval in args.intervals.split(","):
+        result = run_interval(
+            int(interval), args.revisions, args.size, args.rebuilds, args.seed
+        )
+        results.append(result)
+        print(
+            f"  interval {result['snapshot_interval']:4}  "
+            f"{result['stored_bytes_per_revision']:8.0f} B/revision "
+            f"(full copy {result['full_copy_bytes_per_revision']:.0f} B, "
+            f"{result['compression_ratio']:.1f}x)  "
+            f"rebuild p50 {result['rebuild_p50_ms']:6.2f} ms  "
+            f"p95 {result['rebuild_p95_ms']:6.2f} ms  "
+            f"record {result['record_ms']:6.2f} ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
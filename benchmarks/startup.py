@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.harness import percentile
+
+# Runs in a fresh interpreter, so imports are timed cold like a worker boot
+WORKER = """
+import json, time
+started = time.perf_counter()
+import flask, flask_sqlalchemy, sqlalchemy
+dependencies = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+queries = []
+event.listen(Engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+from faqapp import create_app
+imported = time.perf_counter()
+create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import_dependencies_ms": (dependencies - started) * 1000,
+    "import_faqapp_ms": (imported - dependencies) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "total_ms": (created - started) * 1000,
+    "queries": len(queries),
+}))
+"""
+
+FIELDS = ("import_dependencies_ms", "import_faqapp_ms", "create_app_ms", "total_ms")
+
+
+def boot(database_uri):
+    env = dict(os.environ, DATABASE_URI=database_uri, AUTO_MIGRATE="1")
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Boot a worker repeatedly, on a new database each time ("bootstrap")
+# and on a database already set up by "flask init-db" ("fast_start")
+def run(runs):
+    directory = tempfile.mkdtemp(prefix="faqapp-bench-")
+    ready_uri = "sqlite:///" + os.path.join(directory, "ready.db")
+    boot(ready_uri)
+
+    scenarios = {
+        "bootstrap": lambda i: boot(
+            "sqlite:///" + os.path.join(directory, f"new-{i}.db")
+        ),
+        "fast_start": lambda i: boot(ready_uri),
+    }
+
+    results = {}
+    for name, scenario in scenarios.items():
+        samples = [scenario(i) for i in range(runs)]
+        result = {"queries": samples[-1]["queries"]}
+        for field in FIELDS:
+            values = [sample[field] for sample in samples]
+            result[field] = {
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+            }
+        results[name] = result
+
+        print(
+            f"  {name:12}"
+            + "".join(
+                f"  {field[:-3]} {result[field]['p50']:7.1f} ms" for field in FIELDS
+            )
+            + f"  {result['queries']} queries"
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker startup time.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = run(args.runs)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
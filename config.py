@@ -10,4 +10,93 @@ class Config:
     ) or "sqlite:///" + os.path.join(basedir, "faqapp.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     ADMIN_USER = "admin"
-    ADMIN_PW = "admin"
\ No newline at end of file
+    ADMIN_PW = "admin"
+    # Set up or upgrade the database on startup when its schema version is behind,
+    # otherwise run "flask init-db". Up to date databases are never touched.
+    AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "1") == "1"
+    # Debug/test mode: raise instead of silently lazy loading relationships
+    RAISE_ON_LAZY_LOAD = bool(os.environ.get("RAISE_ON_LAZY_LOAD"))
+    NOTES_PER_PAGE = int(os.environ.get("NOTES_PER_PAGE") or 20)
+    API_MAX_PER_PAGE = 200
+    # Most notes moved or deleted by one bulk operation
+    BULK_MAX_NOTES = 1000
+    # Notes inserted per transaction, and largest file read by the importer
+    IMPORT_BATCH_SIZE = 1000
+    IMPORT_MAX_FILE_SIZE = 5 * 1024 * 1024
+    # Logged-in users are cached per process, other workers see
+    # permission changes within PRINCIPAL_CACHE_TTL seconds
+    PRINCIPAL_CACHE_SIZE = 1024
+    PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL") or 5)
+    # Rendered note and sidebar HTML kept per process, in characters
+    FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE") or 8 * 1024 * 1024)
+    # Note revisions between full snapshots, bounds the deltas applied to rebuild one
+    REVISION_SNAPSHOT_INTERVAL = 20
+    # Note titles and category names held in memory for typeahead lookups,
+    # in index keys (one per word of each title, roughly 150 bytes each).
+    # Above that lookups go to the database. Changes made by other workers
+    # show up within TYPEAHEAD_REFRESH_INTERVAL seconds.
+    TYPEAHEAD_MAX_ENTRIES = 500_000
+    TYPEAHEAD_REFRESH_INTERVAL = float(os.environ.get("TYPEAHEAD_REFRESH_INTERVAL") or 30)
+    # Re-render notes of an older renderer version in a background thread of
+    # one worker, in batches with a pause between them to leave room for writers.
+    # Another worker takes over if that one stops for RENDER_LEASE_SECONDS.
+    BACKGROUND_RENDER = os.environ.get("BACKGROUND_RENDER", "1") == "1"
+    RENDER_BATCH_SIZE = 500
+    RENDER_BATCH_PAUSE = 0.05
+    RENDER_LEASE_SECONDS = 60
+    # PRAGMAs applied to every new SQLite connection
+    SQLITE_PRAGMAS = {}
+    # Part of every ETag, set it to e.g. the release tag or commit hash.
+    # Left empty, a hash of the application code is used.
+    BUILD_ID = os.environ.get("BUILD_ID")
+    # Async driver URL for the ASGI read path (faqapp.asgi), derived for SQLite
+    ASYNC_DATABASE_URI = os.environ.get("ASYNC_DATABASE_URI")
+    # Engine options for the async engine, kept apart from SQLALCHEMY_ENGINE_OPTIONS
+    # since aiosqlite runs without a connection pool
+    ASYNC_ENGINE_OPTIONS = {}
+    # Per-request timings in a Server-Timing header and Prometheus histograms at /metrics
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+    # Bearer token for scraping /metrics, otherwise only admins can read it
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    # Log statements slower than this many milliseconds, None disables the log
+    SLOW_QUERY_THRESHOLD_MS = (
+        float(os.environ["SLOW_QUERY_THRESHOLD_MS"])
+        if os.environ.get("SLOW_QUERY_THRESHOLD_MS")
+        else None
+    )
+
+
+# Production profile for SQLite: WAL journaling so readers don't block writers,
+# a busy timeout instead of immediate "database is locked" errors,
+# and larger page cache / memory mapped I/O for read-heavy traffic
+class ProductionConfig(Config):
+    # Workers never set up the database, run "flask init-db" once per deploy
+    AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE") == "1"
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "foreign_keys": "ON",
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT") or 5000),
+        "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE") or -64000),
+        "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE") or 268435456),
+        "temp_store": "MEMORY",
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.environ.get("DATABASE_POOL_SIZE") or 10),
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        # Connections are reused across threads of the same worker
+        "connect_args": {"check_same_thread": False, "timeout": 5},
+    }
+    ASYNC_ENGINE_OPTIONS = {"connect_args": {"timeout": 5}}
+
+
+configs = {
+    "default": Config,
+    "production": ProductionConfig,
+}
+
+
+# Pick the config profile named by the FAQAPP_CONFIG environment variable
+def get_config():
+    return configs[os.environ.get("FAQAPP_CONFIG") or "default"]
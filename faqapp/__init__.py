@@ -1,52 +1,78 @@
 from flask import Flask
-from werkzeug.security import generate_password_hash
 
-from config import Config
-from faqapp.extensions import db
+from config import get_config
+from faqapp.extensions import (
+    db,
+    init_after_commit,
+    init_lazy_load_guard,
+    init_sqlite_pragmas,
+)
 
 
 # Create the app
-def create_app(config_Class=Config):
+def create_app(config_Class=None):
+    if config_Class is None:
+        config_Class = get_config()
+
     app = Flask(__name__)
     app.config.from_object(config_Class)
 
     # Initialize database
     db.init_app(app)
+    init_sqlite_pragmas(app)
+    init_lazy_load_guard(app)
+    init_after_commit()
+
+    # Initialize rendered fragment cache
+    from faqapp.fragments import init_fragment_cache
+
+    init_fragment_cache(app)
+
+    # Deploy token for ETags
+    from faqapp.conditional import init_conditional
+
+    init_conditional(app)
 
-    # Import models and create database tables
-    from faqapp.models import User, Note, Category
+    # Initialize request timings, /metrics and the slow query log
+    from faqapp.metrics import init_metrics
+
+    init_metrics(app)
 
     with app.app_context():
-        db.create_all()
-
-        # Create general category to start with
-        general_category = db.session.execute(
-            db.select(Category).where(Category.name == "General")
-        ).scalar()
-
-        if general_category is None:
-            general_category = Category(
-                name="General",
-                level=0,
-                tree="000",
-            )
-            db.session.add(general_category)
-            db.session.commit()
-
-        # Create default admin user under id = 1
-        admin = db.session.execute(
-            db.select(User).where(User.id == 1)
-        ).scalar()
-
-        if admin is None:
-            admin = User(
-                id = 1,
-                name = config_Class.ADMIN_USER,
-                permission_level = 4,
-                hash = generate_password_hash(config_Class.ADMIN_PW)
+        # Workers starting on an up to date database skip all setup work,
+        # otherwise the database is set up here or with "flask init-db"
+        from faqapp.bootstrap import init_database, schema_is_current
+
+        database_ready = schema_is_current()
+        if not database_ready and app.config["AUTO_MIGRATE"]:
+            init_database()
+            database_ready = True
+        elif not database_ready:
+            app.logger.warning(
+                'Database schema is out of date, run "flask init-db" to upgrade it.'
             )
-            db.session.add(admin)
-            db.session.commit()
+
+    # Database setup and maintenance commands
+    from faqapp.bootstrap import init_db_command
+    from faqapp.migrations import migrate_command
+    from faqapp.counts import check_counts_command
+    from faqapp.content import render_notes_command
+
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(check_counts_command)
+    app.cli.add_command(render_notes_command)
+
+    # Typeahead index of note titles and category names, built in the background
+    from faqapp.typeahead import init_typeahead
+
+    init_typeahead(app, build=database_ready)
+
+    # Re-render stale notes in one worker, without holding up requests
+    if database_ready and app.config["BACKGROUND_RENDER"]:
+        from faqapp.content import init_background_render
+
+        init_background_render(app)
 
     # Register blueprints
     from . import faq
@@ -61,4 +87,16 @@ def create_app(config_Class=Config):
 
     app.register_blueprint(users.bp)
 
+    from . import search
+
+    app.register_blueprint(search.bp)
+
+    from . import api
+
+    app.register_blueprint(api.bp)
+
+    from . import importer
+
+    app.register_blueprint(importer.bp)
+
     return app
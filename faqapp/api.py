@@ -0,0 +1,313 @@
+import json
+
+from flask import (
+    abort,
+    Blueprint,
+    current_app,
+    g,
+    jsonify,
+    request,
+    Response,
+    stream_with_context,
+    url_for,
+)
+from werkzeug.exceptions import HTTPException
+
+from faqapp.auth import api_login_required
+from faqapp.categories import get_category_tree
+from faqapp.conditional import conditional_get
+from faqapp.extensions import db
+from faqapp.faq import bulk_update_notes, select_notes
+from faqapp.models import Note, User, Category
+from faqapp.pagination import paginate_notes
+from faqapp.typeahead import suggest
+from faqapp.search import (
+    build_match_expression,
+    highlight_filter,
+    search_available,
+    search_query,
+)
+
+bp = Blueprint("api", __name__, url_prefix="/api")
+
+# Rows fetched per round trip while exporting
+EXPORT_BATCH_SIZE = 1000
+
+# Typeahead suggestions returned by default, and at most
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MAX_LIMIT = 50
+
+
+# List notes, paginated with the same cursors as the HTML views.
+# Notes come with previews, full content only with content=1.
+@bp.route("/notes")
+@api_login_required
+@conditional_get
+def list_notes():
+    content = with_content(request.args)
+    query = filter_notes(select_notes(content), request.args, get_category_tree())
+
+    page = paginate_notes(
+        query,
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+        per_page=page_size(request.args, current_app.config),
+    )
+
+    return jsonify(page_to_dict(page, content))
+
+
+# Get a single note
+@bp.route("/notes/<int:id>")
+@api_login_required
+@conditional_get
+def get_note(id):
+    note = db.session.execute(select_notes(content=True).where(Note.id == id)).scalar()
+
+    if note is None:
+        abort(404, "Note doesn't exist.")
+
+    return jsonify(note_to_dict(note))
+
+
+# Get the category tree
+@bp.route("/categories")
+@api_login_required
+@conditional_get
+def list_categories():
+    return jsonify(categories=[category_to_dict(c) for c in get_category_tree().roots])
+
+
+# Note titles and category names starting with q (or with a word starting with q),
+# answered from the in-memory index without touching the database
+@bp.route("/typeahead")
+@api_login_required
+def typeahead():
+    prefix = request.args.get("q", "").strip()
+    limit = request.args.get("limit", TYPEAHEAD_LIMIT, type=int)
+    limit = min(max(limit, 1), TYPEAHEAD_MAX_LIMIT)
+
+    results = suggest(prefix, limit) if prefix else []
+
+    return jsonify(
+        results=[
+            {
+                "type": kind,
+                "id": item_id,
+                "title": title,
+                "url": url_for("faq.show_note", id=item_id)
+                if kind == "note"
+                else url_for("faq.notes_by_category", id=item_id),
+            }
+            for kind, item_id, title in results
+        ]
+    )
+
+
+# Search notes, with matches wrapped in <mark> in title_html and snippet_html
+@bp.route("/search")
+@api_login_required
+@conditional_get
+def search_notes():
+    if not search_available():
+        abort(501, "Search requires SQLite with FTS5.")
+
+    stmt = search_from_args(request.args, get_category_tree(), current_app.config)
+    rows = db.session.execute(stmt).all() if stmt is not None else []
+
+    return jsonify(search_results_to_dict(rows, request.args, current_app.config))
+
+
+# Move or delete many notes at once, with the same checks as the bulk form.
+# Takes {"ids": [...], "action": "move" or "delete", "category": id}.
+@bp.route("/notes/bulk", methods=("POST",))
+@api_login_required
+def bulk_notes():
+    if g.user.permission_level < 2:
+        abort(403, "You don't have permission to change notes.")
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("ids"), list):
+        abort(400, "Expected a JSON object with a list of note ids.")
+
+    try:
+        note_ids = [int(note_id) for note_id in data["ids"]]
+        category_id = int(data["category"]) if data.get("category") is not None else None
+    except (TypeError, ValueError):
+        abort(400, "Note and category ids must be numbers.")
+
+    action = data.get("action")
+    count = bulk_update_notes(note_ids, action, category_id)
+    db.session.commit()
+
+    return jsonify({"moved" if action == "move" else "deleted": count})
+
+
+# Stream the whole knowledge base as newline-delimited JSON.
+# Categories come first, then notes fetched in batches, so memory use
+# stays flat regardless of the number of notes.
+@bp.route("/export")
+@api_login_required
+def export():
+    def generate():
+        for category in get_category_tree().flat:
+            yield dump_line(
+                type="category",
+                id=category.id,
+                name=category.name,
+                level=category.level,
+                tree=category.tree,
+            )
+
+        rows = db.session.execute(
+            db.select(
+                Note.id,
+                Note.title,
+                Note.content,
+                Note.category,
+                Note.create_date,
+                Note.update_date,
+                User.name.label("author"),
+            )
+            .outerjoin(Note.author)
+            .order_by(Note.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+
+        for row in rows:
+            yield dump_line(
+                type="note",
+                id=row.id,
+                title=row.title,
+                content=row.content,
+                category_id=row.category,
+                author=row.author,
+                create_date=format_date(row.create_date),
+                update_date=format_date(row.update_date),
+            )
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=faqapp.ndjson"},
+    )
+
+
+# Return API errors as JSON instead of HTML pages
+@bp.errorhandler(HTTPException)
+def handle_error(error):
+    return jsonify(error=error.description), error.code
+
+
+# The helpers below take the query arguments and config explicitly,
+# they're shared with the async read path in faqapp.asgi
+
+
+# Narrow a select() of notes down to the category (and subtree) in the arguments
+def filter_notes(query, args, category_tree):
+    category_id = args.get("category", type=int)
+    if category_id is None:
+        return query
+
+    category = category_tree.by_id.get(category_id)
+    if category is None:
+        abort(404, "Category doesn't exist.")
+
+    if args.get("subtree") == "1":
+        return query.where(Category.in_subtree(category.tree))
+    return query.where(Note.category == category_id)
+
+
+def with_content(args):
+    return args.get("content") == "1"
+
+
+def page_size(args, config):
+    per_page = min(
+        args.get("per_page", config["NOTES_PER_PAGE"], type=int),
+        config["API_MAX_PER_PAGE"],
+    )
+    return max(per_page, 1)
+
+
+# Search statement for the q, cat and page arguments, None without search terms
+def search_from_args(args, category_tree, config):
+    match = build_match_expression(args.get("q", ""))
+    if not match:
+        return None
+
+    return search_query(
+        match,
+        category_tree.by_id.get(args.get("cat", type=int)),
+        search_page(args),
+        page_size(args, config),
+    )
+
+
+def search_page(args):
+    return max(args.get("page", 1, type=int), 1)
+
+
+def search_results_to_dict(rows, args, config):
+    per_page = page_size(args, config)
+    page = search_page(args)
+    return {
+        "results": [
+            {
+                "id": row.id,
+                "title_html": str(highlight_filter(row.title)),
+                "snippet_html": str(highlight_filter(row.snippet)),
+                "category": {"id": row.category_id, "name": row.category},
+                "author": row.author,
+                "create_date": format_date(row.create_date),
+            }
+            for row in rows[:per_page]
+        ],
+        "page": page,
+        "next_page": page + 1 if len(rows) > per_page else None,
+    }
+
+
+def page_to_dict(page, content=False):
+    return {
+        "notes": [note_to_dict(note, content) for note in page.items],
+        "next": page.next_cursor,
+        "prev": page.prev_cursor,
+    }
+
+
+def note_to_dict(note, content=True):
+    data = {
+        "id": note.id,
+        "title": note.title,
+        "preview": note.preview,
+        "preview_html": note.preview_html,
+        "content_size": note.content_size,
+        "category": {"id": note.category_name.id, "name": note.category_name.name},
+        "author": note.author.name,
+        "create_date": format_date(note.create_date),
+        "update_date": format_date(note.update_date),
+    }
+    if content:
+        data["content"] = note.content
+        data["content_html"] = note.content_html
+    return data
+
+
+def category_to_dict(category):
+    return {
+        "id": category.id,
+        "name": category.name,
+        "level": category.level,
+        "note_count": category.note_count,
+        "subtree_note_count": category.subtree_note_count,
+        "subcategories": [category_to_dict(c) for c in category.subcategories],
+    }
+
+
+def format_date(value):
+    return value.isoformat() if value is not None else None
+
+
+def dump_line(**fields):
+    return json.dumps(fields, ensure_ascii=False) + "\n"
@@ -0,0 +1,249 @@
+import re
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from sqlalchemy import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException, abort
+from werkzeug.http import parse_cookie, parse_etags
+
+from faqapp import create_app
+from faqapp.api import (
+    filter_notes,
+    page_size,
+    page_to_dict,
+    note_to_dict,
+    category_to_dict,
+    search_from_args,
+    search_results_to_dict,
+    with_content,
+)
+from faqapp.categories import category_rows_query, make_category_tree
+from faqapp.conditional import ETAG_VERSIONS, make_etag
+from faqapp.extensions import db, init_sqlite_pragmas
+from faqapp.faq import select_notes
+from faqapp.models import Counter, Note, User
+from faqapp.pagination import make_page, page_query
+from faqapp.principals import Principal
+from faqapp.versions import CATEGORY_VERSION
+
+
+# What an async read view needs to know about the request
+class ReadRequest:
+    def __init__(self, scope):
+        self.path = scope["path"]
+        self.query_string = scope["query_string"].decode("latin-1")
+        self.args = MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.headers = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+        }
+        self.cookies = parse_cookie(self.headers.get("cookie", ""))
+
+    # Same as Flask's request.full_path, so ETags match the sync views
+    @property
+    def full_path(self):
+        return f"{self.path}?{self.query_string}"
+
+
+# ASGI application serving the read-only JSON API through an async engine.
+# A reader waiting on SQLite only holds a coroutine, not a worker thread,
+# so one process serves many concurrent readers. Every other request,
+# including all writes, is passed to the Flask app in a thread pool.
+class AsyncReadApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+
+        self.engine = create_async_engine(
+            async_database_uri(flask_app.config),
+            **flask_app.config["ASYNC_ENGINE_OPTIONS"],
+        )
+        init_sqlite_pragmas(flask_app, self.engine.sync_engine)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        self.routes = (
+            (re.compile(r"/api/notes"), self.list_notes),
+            (re.compile(r"/api/notes/(?P<id>\d+)"), self.get_note),
+            (re.compile(r"/api/categories"), self.list_categories),
+            (re.compile(r"/api/search"), self.search_notes),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            for pattern, view in self.routes:
+                match = pattern.fullmatch(scope["path"])
+                if match:
+                    await self.dispatch(view, scope, send, **match.groupdict())
+                    return
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # Run a view the way api_login_required and conditional_get would
+    async def dispatch(self, view, scope, send, **kwargs):
+        request = ReadRequest(scope)
+        headers = [(b"content-type", b"application/json")]
+
+        async with self.sessionmaker() as session:
+            try:
+                session_data = self.load_session(request)
+                user = await self.load_principal(session, session_data.get("user_id"))
+                if user is None:
+                    abort(401, "Login required.")
+
+                # Pending flash messages are rendered once, never skip them
+                etag = None
+                if not session_data.get("_flashes"):
+                    versions = await self.get_versions(session, *ETAG_VERSIONS)
+                    etag = make_etag(
+                        self.flask_app.config["BUILD_ID"],
+                        versions,
+                        user,
+                        request.full_path,
+                    )
+
+                if_none_match = parse_etags(request.headers.get("if-none-match"))
+                if etag is not None and if_none_match.contains(etag):
+                    status, body = 304, b""
+                else:
+                    status = 200
+                    body = self.dumps(await view(session, request, **kwargs))
+
+                if etag is not None:
+                    headers += [
+                        (b"etag", f'"{etag}"'.encode()),
+                        (b"cache-control", b"private, no-cache"),
+                        (b"vary", b"Cookie"),
+                    ]
+            except HTTPException as error:
+                status, body = error.code, self.dumps({"error": error.description})
+
+        if scope["method"] == "HEAD":
+            body = b""
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    def dumps(self, data):
+        return (self.flask_app.json.dumps(data) + "\n").encode()
+
+    # Read the signed Flask session cookie
+    def load_session(self, request):
+        cookie = request.cookies.get(self.flask_app.config["SESSION_COOKIE_NAME"])
+        serializer = self.flask_app.session_interface.get_signing_serializer(
+            self.flask_app
+        )
+        if not cookie or serializer is None:
+            return {}
+
+        max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            return serializer.loads(cookie, max_age=max_age)
+        except BadSignature:
+            return {}
+
+    async def load_principal(self, session, user_id):
+        if user_id is None:
+            return None
+
+        row = (
+            await session.execute(
+                db.select(User.id, User.name, User.permission_level).where(
+                    User.id == user_id
+                )
+            )
+        ).first()
+        return Principal(*row) if row is not None else None
+
+    async def get_versions(self, session, *names):
+        values = dict(
+            (
+                await session.execute(
+                    db.select(Counter.name, Counter.value).where(
+                        Counter.name.in_(names)
+                    )
+                )
+            ).all()
+        )
+        return tuple(values.get(name, 0) for name in names)
+
+    # Same per-process category tree the sync views use
+    async def get_category_tree(self, session):
+        (version,) = await self.get_versions(session, CATEGORY_VERSION)
+
+        cached = self.flask_app.extensions.get("faqapp.category_tree")
+        if cached is not None and cached.version == version:
+            return cached
+
+        rows = (await session.execute(category_rows_query())).all()
+        cached = make_category_tree(version, rows)
+        self.flask_app.extensions["faqapp.category_tree"] = cached
+        return cached
+
+    async def list_notes(self, session, request):
+        category_tree = await self.get_category_tree(session)
+        content = with_content(request.args)
+        query = filter_notes(select_notes(content), request.args, category_tree)
+
+        after = request.args.get("after")
+        before = request.args.get("before")
+        per_page = page_size(request.args, self.flask_app.config)
+
+        rows = (await session.execute(page_query(query, after, before, per_page))).all()
+        return page_to_dict(make_page(rows, after, before, per_page), content)
+
+    async def get_note(self, session, request, id):
+        note = (
+            await session.execute(select_notes(content=True).where(Note.id == int(id)))
+        ).scalar()
+
+        if note is None:
+            abort(404, "Note doesn't exist.")
+
+        return note_to_dict(note)
+
+    async def list_categories(self, session, request):
+        category_tree = await self.get_category_tree(session)
+        return {"categories": [category_to_dict(c) for c in category_tree.roots]}
+
+    async def search_notes(self, session, request):
+        if self.engine.dialect.name != "sqlite":
+            abort(501, "Search requires SQLite with FTS5.")
+
+        category_tree = await self.get_category_tree(session)
+        stmt = search_from_args(request.args, category_tree, self.flask_app.config)
+        rows = (await session.execute(stmt)).all() if stmt is not None else []
+
+        return search_results_to_dict(rows, request.args, self.flask_app.config)
+
+
+# Async driver URL for the app's database, SQLite goes through aiosqlite
+def async_database_uri(config):
+    if config.get("ASYNC_DATABASE_URI"):
+        return config["ASYNC_DATABASE_URI"]
+
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() != "sqlite":
+        raise RuntimeError("Set ASYNC_DATABASE_URI to an async driver for this database.")
+    return url.set(drivername="sqlite+aiosqlite")
+
+
+# ASGI app factory, e.g. "uvicorn --factory faqapp.asgi:create_asgi_app"
+def create_asgi_app(config_Class=None):
+    return AsyncReadApp(create_app(config_Class))
@@ -0,0 +1,78 @@
+import click
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import generate_password_hash
+
+from faqapp.extensions import db, lock_database
+from faqapp.migrations import latest_version, run_migrations
+from faqapp.models import Category, User, tree_segment
+from faqapp.search import init_search_index
+from faqapp.versions import SCHEMA_VERSION, get_version
+
+
+# Whether the database has every migration applied, in a single query.
+# A database without the counter table hasn't been set up at all.
+def schema_is_current():
+    try:
+        return get_version(SCHEMA_VERSION) == latest_version()
+    except OperationalError:
+        db.session.rollback()
+        return False
+
+
+# Set up a new database or bring an existing one up to date: create missing
+# tables, apply migrations, add the General category and the admin user and
+# create the search index. Everything is skipped if already there, so it's
+# safe to run again, and each step holds the write lock so concurrent runs
+# wait for each other instead of creating things twice.
+def init_database():
+    lock_database()
+    db.metadata.create_all(db.session.connection())
+    db.session.commit()
+
+    applied = run_migrations()
+
+    lock_database()
+
+    # Create general category to start with
+    general_category = db.session.execute(
+        db.select(Category).where(Category.name == "General")
+    ).scalar()
+
+    if general_category is None:
+        general_category = Category(
+            name="General",
+            level=0,
+            tree=tree_segment(0),
+        )
+        db.session.add(general_category)
+
+    # Create default admin user under id = 1
+    admin = db.session.execute(
+        db.select(User).where(User.id == 1)
+    ).scalar()
+
+    if admin is None:
+        admin = User(
+            id = 1,
+            name = current_app.config["ADMIN_USER"],
+            permission_level = 4,
+            hash = generate_password_hash(current_app.config["ADMIN_PW"])
+        )
+        db.session.add(admin)
+
+    # Create full-text search index for notes
+    init_search_index()
+    db.session.commit()
+
+    return applied
+
+
+# Set up or upgrade the database, once per deployment instead of on every worker start
+@click.command("init-db")
+def init_db_command():
+    applied = init_database()
+
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(map(str, applied))}.")
+    click.echo(f"Database is ready (schema version {latest_version()}).")
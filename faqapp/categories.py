@@ -0,0 +1,97 @@
+import threading
+from types import MappingProxyType
+from typing import NamedTuple
+
+from flask import current_app
+
+from faqapp.extensions import db
+from faqapp.models import Category, parent_tree
+from faqapp.versions import CATEGORY_VERSION, get_version
+
+
+# Read-only snapshot of a single category and its children
+class CategoryNode(NamedTuple):
+    id: int
+    name: str
+    level: int
+    tree: str
+    subcategory_count: int
+    note_count: int
+    subtree_note_count: int
+    subcategories: tuple
+
+
+# Precomputed category tree, shared by all requests in the process
+class CategoryTree(NamedTuple):
+    version: int
+    # Top level categories, each holding its subcategories
+    roots: tuple
+    # All categories in tree order, for flat listings
+    flat: tuple
+    by_id: MappingProxyType
+
+
+_cache_lock = threading.Lock()
+
+
+# Get the category tree, rebuilding it only when the category version changed.
+# The version lives in the database, so every worker process notices changes.
+def get_category_tree():
+    version = get_version(CATEGORY_VERSION)
+
+    cached = current_app.extensions.get("faqapp.category_tree")
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _cache_lock:
+        cached = current_app.extensions.get("faqapp.category_tree")
+        if cached is None or cached.version != version:
+            cached = build_category_tree(version)
+            current_app.extensions["faqapp.category_tree"] = cached
+        return cached
+
+
+# Query the database for categories and build an immutable tree from them
+def build_category_tree(version):
+    rows = db.session.execute(category_rows_query()).all()
+    return make_category_tree(version, rows)
+
+
+def category_rows_query():
+    return db.select(
+        Category.id,
+        Category.name,
+        Category.level,
+        Category.tree,
+        Category.subcategory_count,
+        Category.note_count,
+        Category.subtree_note_count,
+    ).order_by(Category.tree)
+
+
+def make_category_tree(version, rows):
+    # Sorting by tree puts every parent before its children,
+    # so walking the rows backwards finishes all children before their parent
+    children = {}
+    nodes = {}
+    for row in reversed(rows):
+        node = CategoryNode(
+            row.id,
+            row.name,
+            row.level,
+            row.tree,
+            row.subcategory_count,
+            row.note_count,
+            row.subtree_note_count,
+            tuple(reversed(children.pop(row.tree, []))),
+        )
+        nodes[row.tree] = node
+        if row.level > 0:
+            children.setdefault(parent_tree(row.tree), []).append(node)
+
+    flat = tuple(nodes[row.tree] for row in rows)
+    roots = tuple(node for node in flat if node.level == 0)
+
+    return CategoryTree(
+        version, roots, flat, MappingProxyType({node.id: node for node in flat})
+    )
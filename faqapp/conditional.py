@@ -0,0 +1,82 @@
+import functools
+import hashlib
+import os
+
+from flask import current_app, g, make_response, request, session
+
+from faqapp.versions import (
+    CATEGORY_VERSION,
+    NOTE_VERSION,
+    USER_VERSION,
+    get_versions,
+)
+
+# Version counters the conditional views depend on
+ETAG_VERSIONS = (NOTE_VERSION, CATEGORY_VERSION, USER_VERSION)
+
+# Files that shape responses, hashed into the default BUILD_ID
+CODE_SUFFIXES = (".py", ".html", ".css", ".js")
+
+
+# Decorator for read views that only depend on notes, categories and users.
+# Sends a strong ETag built from the version counters and the viewing user,
+# and answers matching If-None-Match requests with 304 before running the view.
+def conditional_get(view):
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        # Pending flash messages are rendered once, never skip them
+        if request.method != "GET" or session.get("_flashes"):
+            return view(**kwargs)
+
+        etag = page_etag()
+        if request.if_none_match.contains(etag):
+            response = make_response("", 304)
+        else:
+            response = make_response(view(**kwargs))
+
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add("Cookie")
+        return response
+
+    return wrapped_view
+
+
+def page_etag():
+    versions = get_versions(*ETAG_VERSIONS)
+    return make_etag(
+        current_app.config["BUILD_ID"], versions, g.user, request.full_path
+    )
+
+
+# The async read path builds the same ETags from its own queries.
+# build_id changes with every deploy of different code, so pages cached by
+# browsers before a change to templates or serialization aren't reused.
+def make_etag(build_id, versions, user, full_path):
+    key = f"{build_id}|{versions}|{tuple(user) if user else None}|{full_path}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+# Hash of the package's code and templates. The same in every worker
+# running the same code, unlike e.g. the process start time.
+def code_version():
+    package = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+
+    for directory, subdirectories, files in sorted(os.walk(package)):
+        subdirectories.sort()
+        for name in sorted(files):
+            if not name.endswith(CODE_SUFFIXES):
+                continue
+            path = os.path.join(directory, name)
+            digest.update(os.path.relpath(path, package).encode())
+            with open(path, "rb") as file:
+                digest.update(file.read())
+
+    return digest.hexdigest()[:12]
+
+
+def init_conditional(app):
+    if not app.config.get("BUILD_ID"):
+        app.config["BUILD_ID"] = code_version()
@@ -0,0 +1,244 @@
+import threading
+import time
+
+import click
+from flask import current_app
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from faqapp.extensions import db
+from faqapp.models import Counter, Note
+from faqapp.rendering import RENDERER_VERSION, render_content
+from faqapp.versions import NOTE_VERSION, bump_version
+
+note_table = Note.__table__
+
+# Note lists show the start of each note, stored with the note so list
+# queries never have to load the full bodies
+PREVIEW_LINES = 6
+PREVIEW_CHARS = 400
+
+# Counter holding the time (in seconds since the epoch) until which one
+# process owns the background render, see claim_render_lease
+RENDER_LEASE = "render_lease"
+
+# Columns derived from the content, rewritten when notes are re-rendered
+DERIVED_COLUMNS = (
+    "preview",
+    "content_size",
+    "content_html",
+    "preview_html",
+    "render_version",
+)
+
+
+# First PREVIEW_LINES lines of the content, cut to PREVIEW_CHARS characters
+# at a word boundary where there is one. Always a prefix of the content,
+# so a preview shorter than the content means the note was cut.
+def make_preview(content):
+    preview = "\n".join(content.split("\n", PREVIEW_LINES)[:PREVIEW_LINES])
+    if len(preview) <= PREVIEW_CHARS:
+        return preview
+
+    cut = preview[:PREVIEW_CHARS]
+    boundary = max(cut.rfind(" "), cut.rfind("\n"))
+    return cut[:boundary] if boundary > 0 else cut
+
+
+# Column values for new note content, also usable in bulk inserts.
+# Content is rendered here, once per write, never on page views.
+def content_columns(content):
+    content = content or ""
+    preview = make_preview(content)
+    return {
+        "content": content,
+        "preview": preview,
+        "content_size": len(content),
+        "content_html": render_content(content),
+        "preview_html": render_content(preview),
+        "render_version": RENDERER_VERSION,
+    }
+
+
+def set_note_content(note, content):
+    for name, value in content_columns(content).items():
+        setattr(note, name, value)
+
+
+# Fill in previews for notes written before they were stored,
+# reading batch_size bodies at a time. The caller commits.
+def backfill_previews(batch_size=1000):
+    last_id = 0
+    updated = 0
+
+    while True:
+        rows = db.session.execute(
+            db.select(Note.id, Note.content)
+            .where(Note.id > last_id)
+            .order_by(Note.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return updated
+
+        db.session.execute(
+            note_table.update()
+            .where(note_table.c.id == bindparam("note_id"))
+            .values(preview=bindparam("preview"), content_size=bindparam("size")),
+            [
+                {
+                    "note_id": row.id,
+                    "preview": make_preview(row.content or ""),
+                    "size": len(row.content or ""),
+                }
+                for row in rows
+            ],
+        )
+        last_id = rows[-1].id
+        updated += len(rows)
+
+
+# Render notes stored by an older renderer version (or all notes with
+# everything=True) in batches of batch_size, committing after each batch.
+# A note edited while its batch was being rendered is skipped, its new
+# content has been rendered by the edit already. With lease_seconds, each
+# batch also extends the render lease. Returns the number rendered.
+def rerender_notes(batch_size=None, everything=False, pause=0, lease_seconds=None):
+    batch_size = batch_size or current_app.config["RENDER_BATCH_SIZE"]
+    last_id = 0
+    rendered = 0
+
+    while True:
+        query = (
+            db.select(Note.id, Note.content)
+            .where(Note.id > last_id)
+            .order_by(Note.id)
+            .limit(batch_size)
+        )
+        if not everything:
+            query = query.where(Note.render_version < RENDERER_VERSION)
+
+        rows = db.session.execute(query).all()
+        if not rows:
+            return rendered
+
+        values = []
+        for row in rows:
+            columns = content_columns(row.content)
+            values.append(
+                {
+                    "note_id": row.id,
+                    "old_content": row.content,
+                    **{f"new_{name}": columns[name] for name in DERIVED_COLUMNS},
+                }
+            )
+
+        result = db.session.execute(
+            note_table.update()
+            .where(note_table.c.id == bindparam("note_id"))
+            .where(note_table.c.content.is_not_distinct_from(bindparam("old_content")))
+            .values({name: bindparam(f"new_{name}") for name in DERIVED_COLUMNS}),
+            values,
+        )
+        bump_version(NOTE_VERSION)
+        if lease_seconds:
+            set_render_lease(int(time.time()) + lease_seconds)
+        db.session.commit()
+
+        last_id = rows[-1].id
+        rendered += result.rowcount
+        if pause:
+            time.sleep(pause)
+
+
+def stale_notes_exist():
+    return db.session.execute(
+        db.select(Note.id).where(Note.render_version < RENDERER_VERSION).limit(1)
+    ).first() is not None
+
+
+# Take the background render for this process, unless another process holds
+# an unexpired lease. The lease runs out on its own if its owner dies.
+def claim_render_lease(seconds):
+    now = int(time.time())
+    db.session.execute(
+        sqlite_insert(Counter)
+        .values(name=RENDER_LEASE, value=0)
+        .on_conflict_do_nothing()
+    )
+    claimed = db.session.execute(
+        db.update(Counter)
+        .where(Counter.name == RENDER_LEASE)
+        .where(Counter.value < now)
+        .values(value=now + seconds)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def set_render_lease(expires):
+    db.session.execute(
+        db.update(Counter).where(Counter.name == RENDER_LEASE).values(value=expires)
+    )
+
+
+# After a renderer version bump, re-render stale notes in a daemon thread
+# so the worker keeps serving. Until then read paths show the previously
+# stored HTML. Only the process holding the render lease renders, other
+# workers leave the stale notes to it.
+def start_background_render(app):
+    lease_seconds = app.config["RENDER_LEASE_SECONDS"]
+    with app.app_context():
+        if not stale_notes_exist() or not claim_render_lease(lease_seconds):
+            return None
+
+    def run():
+        with app.app_context():
+            try:
+                rendered = rerender_notes(
+                    pause=app.config["RENDER_BATCH_PAUSE"], lease_seconds=lease_seconds
+                )
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Background note rendering failed")
+            else:
+                app.logger.info("Rendered %s notes in the background", rendered)
+            finally:
+                set_render_lease(0)
+                db.session.commit()
+
+    thread = threading.Thread(target=run, name="faqapp-render", daemon=True)
+    thread.start()
+    return thread
+
+
+# Look for stale notes from requests, so CLI commands, which never handle
+# requests, don't start render threads. A worker that finds the render
+# leased by another one looks again once per lease period, to take over
+# if that one stopped. Nothing is checked after the stale notes are gone.
+def init_background_render(app):
+    lock = threading.Lock()
+    state = {"next_check": 0.0}
+
+    def check():
+        now = time.monotonic()
+        with lock:
+            if state["next_check"] is None or now < state["next_check"]:
+                return
+            state["next_check"] = now + app.config["RENDER_LEASE_SECONDS"]
+
+        with app.app_context():
+            stale = stale_notes_exist()
+        if not stale or start_background_render(app) is not None:
+            with lock:
+                state["next_check"] = None
+
+    app.before_request(check)
+
+
+# Render stored notes now, e.g. after changing the renderer
+@click.command("render-notes")
+@click.option("--all", "everything", is_flag=True, help="Also re-render current notes.")
+def render_notes_command(everything):
+    rendered = rerender_notes(everything=everything)
+    click.echo(f"Rendered {rendered} notes (renderer version {RENDERER_VERSION}).")
@@ -0,0 +1,143 @@
+import click
+from sqlalchemy import bindparam, func
+
+from faqapp.extensions import db
+from faqapp.models import Category, Note, ancestor_trees
+from faqapp.versions import CATEGORY_VERSION, bump_version
+
+category_table = Category.__table__
+
+
+# Apply note count changes, given as {category id: notes added (or removed)}.
+# Each category's note_count changes by its delta, the subtree_note_count of
+# the category and all its ancestors by the sum of the deltas below them.
+# Categories about to be deleted can be passed too, their ancestors are updated.
+# Bumps the category version, the caller commits.
+def adjust_note_counts(deltas):
+    deltas = {
+        int(category_id): delta for category_id, delta in deltas.items() if delta
+    }
+    if not deltas:
+        return
+
+    trees = dict(
+        db.session.execute(
+            db.select(Category.id, Category.tree).where(Category.id.in_(deltas))
+        ).all()
+    )
+
+    deltas = {
+        category_id: delta
+        for category_id, delta in deltas.items()
+        if category_id in trees
+    }
+    if not deltas:
+        return
+
+    db.session.execute(
+        category_table.update()
+        .where(category_table.c.id == bindparam("category_id"))
+        .values(note_count=category_table.c.note_count + bindparam("delta")),
+        [
+            {"category_id": category_id, "delta": delta}
+            for category_id, delta in deltas.items()
+        ],
+    )
+    adjust_subtree_counts(
+        {trees[category_id]: delta for category_id, delta in deltas.items()}
+    )
+
+
+# Add deltas, given as {tree: delta}, to the subtree_note_count of each tree
+# and all its ancestors, with one statement per affected category
+def adjust_subtree_counts(tree_deltas):
+    totals = {}
+    for tree, delta in tree_deltas.items():
+        for ancestor in ancestor_trees(tree):
+            totals[ancestor] = totals.get(ancestor, 0) + delta
+
+    totals = {tree: delta for tree, delta in totals.items() if delta}
+    if not totals:
+        return
+
+    db.session.execute(
+        category_table.update()
+        .where(category_table.c.tree == bindparam("category_tree"))
+        .values(
+            subtree_note_count=category_table.c.subtree_note_count + bindparam("delta")
+        ),
+        [{"category_tree": tree, "delta": delta} for tree, delta in totals.items()],
+    )
+    bump_version(CATEGORY_VERSION)
+
+
+# Notes per category, counted the slow way
+def count_notes():
+    note_counts = dict(
+        db.session.execute(
+            db.select(Note.category, func.count()).group_by(Note.category)
+        ).all()
+    )
+    rows = db.session.execute(
+        db.select(
+            Category.id,
+            Category.tree,
+            Category.note_count,
+            Category.subtree_note_count,
+        )
+    ).all()
+
+    ids_by_tree = {row.tree: row.id for row in rows}
+    subtree_counts = {}
+    for row in rows:
+        count = note_counts.get(row.id, 0)
+        for ancestor in ancestor_trees(row.tree):
+            if ancestor in ids_by_tree:
+                ancestor_id = ids_by_tree[ancestor]
+                subtree_counts[ancestor_id] = subtree_counts.get(ancestor_id, 0) + count
+
+    return [
+        (row, note_counts.get(row.id, 0), subtree_counts.get(row.id, 0))
+        for row in rows
+    ]
+
+
+# Recount notes and fix categories whose stored counts drifted.
+# Returns the number of categories that were wrong, the caller commits.
+def repair_note_counts(dry_run=False):
+    wrong = [
+        {"category_id": row.id, "note_count": count, "subtree_note_count": subtree}
+        for row, count, subtree in count_notes()
+        if (row.note_count, row.subtree_note_count) != (count, subtree)
+    ]
+
+    if wrong and not dry_run:
+        db.session.execute(
+            category_table.update()
+            .where(category_table.c.id == bindparam("category_id"))
+            .values(
+                note_count=bindparam("note_count"),
+                subtree_note_count=bindparam("subtree_note_count"),
+            ),
+            wrong,
+        )
+        bump_version(CATEGORY_VERSION)
+
+    return len(wrong)
+
+
+# Check stored note counts against the notes, and fix them with --repair
+@click.command("check-counts")
+@click.option("--repair", is_flag=True, help="Fix wrong counts.")
+def check_counts_command(repair):
+    wrong = repair_note_counts(dry_run=not repair)
+
+    if not wrong:
+        click.echo("All category note counts are correct.")
+    elif repair:
+        db.session.commit()
+        click.echo(f"Fixed note counts of {wrong} categories.")
+    else:
+        raise click.ClickException(
+            f"{wrong} categories have wrong note counts, run with --repair to fix them."
+        )
@@ -1,4 +1,6 @@
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
 from sqlalchemy.orm import DeclarativeBase
 
 
@@ -7,3 +9,90 @@ class Base(DeclarativeBase):
 
 
 db = SQLAlchemy(model_class=Base)
+
+
+# Raised in RAISE_ON_LAZY_LOAD mode when a relationship is lazy loaded
+class LazyLoadError(RuntimeError):
+    pass
+
+
+# Fail loudly on lazy relationship loads, to catch N+1 queries in views
+def _raise_on_lazy_load(orm_execute_state):
+    if not orm_execute_state.is_select or not has_app_context():
+        return
+
+    if orm_execute_state.lazy_loaded_from is None:
+        return
+
+    if current_app.config.get("RAISE_ON_LAZY_LOAD"):
+        state = orm_execute_state.lazy_loaded_from
+        raise LazyLoadError(
+            f"Lazy load on {state.class_.__name__} {state.identity}, "
+            "load the relationship eagerly in the view's query."
+        )
+
+
+def init_lazy_load_guard(app):
+    if app.config.get("RAISE_ON_LAZY_LOAD") and not event.contains(
+        db.session, "do_orm_execute", _raise_on_lazy_load
+    ):
+        event.listen(db.session, "do_orm_execute", _raise_on_lazy_load)
+
+
+# Start a transaction holding SQLite's write lock, instead of taking it at
+# the first write. Other writers wait (up to the busy timeout) until commit.
+# Anything read before is expired, so it's read again under the lock.
+def lock_database():
+    db.session.commit()
+    if db.engine.dialect.name == "sqlite":
+        db.session.execute(text("BEGIN IMMEDIATE"))
+
+
+# Run callback once the current transaction is committed, for per-process
+# caches that must only change along with the database. Callbacks of a
+# transaction that is rolled back are dropped.
+def after_commit(callback):
+    db.session.info.setdefault("after_commit", []).append(callback)
+
+
+# Version counters bumped by the transaction become its committed_versions
+# (see faqapp.versions) before the callbacks run
+def _run_after_commit(session):
+    session.info["committed_versions"] = session.info.pop("version_bumps", {})
+    for callback in session.info.pop("after_commit", []):
+        callback()
+
+
+def _drop_after_commit(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("after_commit", None)
+        session.info.pop("version_bumps", None)
+
+
+def init_after_commit():
+    if not event.contains(db.session, "after_commit", _run_after_commit):
+        event.listen(db.session, "after_commit", _run_after_commit)
+        event.listen(db.session, "after_soft_rollback", _drop_after_commit)
+
+
+# Apply the configured PRAGMAs to every new SQLite connection,
+# of the app's engine or of another engine on the same database
+def init_sqlite_pragmas(app, engine=None):
+    pragmas = app.config.get("SQLITE_PRAGMAS")
+    if not pragmas:
+        return
+
+    if engine is None:
+        with app.app_context():
+            engine = db.engine
+
+    if engine.dialect.name != "sqlite":
+        return
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    event.listen(engine, "connect", set_pragmas)
@@ -1,18 +1,34 @@
 from flask import (
     abort,
     Blueprint,
+    current_app,
     flash,
     g,
+    jsonify,
     redirect,
     render_template,
     request,
     url_for,
 )
+from collections import Counter
 from datetime import datetime, timezone
+from functools import partial
+from sqlalchemy.orm import contains_eager, defer
+from werkzeug.exceptions import HTTPException
 
-from faqapp.extensions import db
-from faqapp.models import Note, User, Category
+from faqapp.extensions import after_commit, db, lock_database
+from faqapp.models import Note, NoteRevision, User, Category
 from faqapp.auth import login_required, level_required
+from faqapp.categories import get_category_tree
+from faqapp.pagination import paginate_notes
+from faqapp.conditional import conditional_get
+from faqapp.content import content_columns, set_note_content
+from faqapp.counts import adjust_note_counts
+from faqapp.fragments import get_fragment_cache
+from faqapp.hierarchy import MoveError, allocate_tree, move_subtree
+from faqapp.revisions import diff_lines, rebuild_revisions, record_revision
+from faqapp.typeahead import get_typeahead_index
+from faqapp.versions import CATEGORY_VERSION, NOTE_VERSION, bump_version
 
 bp = Blueprint("faq", __name__)
 
@@ -20,39 +36,64 @@ bp = Blueprint("faq", __name__)
 # Homepage
 @bp.route("/")
 @login_required
+@conditional_get
 def index():
-    categories = build_category_tree(load_categories())
+    category_tree = get_category_tree()
 
-    faqs = (
-        db.session.execute(
-            db.select(Note).join(User).join(Category).order_by(Note.create_date)
-        )
-        .scalars()
-        .all()
+    page = paginate_notes(
+        select_notes(),
+        after=request.args.get("after"),
+        before=request.args.get("before"),
     )
 
-    return render_template("faq/index.html", faqs=faqs, categories=categories)
+    return render_template("faq/index.html", page=page, category_tree=category_tree)
 
 
 # Display notes by category
 @bp.route("/cat/<int:id>")
 @login_required
+@conditional_get
 def notes_by_category(id):
-    categories = build_category_tree(load_categories())
-
-    faqs = (
-        db.session.execute(
-            db.select(Note)
-            .join(User)
-            .join(Category)
-            .order_by(Note.create_date)
-            .where(Note.category == id)
-        )
-        .scalars()
-        .all()
+    category_tree = get_category_tree()
+    category = category_tree.by_id.get(id)
+
+    if category is None:
+        abort(404, "Category doesn't exist.")
+
+    # Optionally include notes from all subcategories,
+    # using a range scan on the tree column instead of one query per category
+    subtree = request.args.get("subtree") == "1"
+    if subtree:
+        query = select_notes().where(Category.in_subtree(category.tree))
+    else:
+        query = select_notes().where(Note.category == id)
+
+    page = paginate_notes(
+        query,
+        after=request.args.get("after"),
+        before=request.args.get("before"),
     )
 
-    return render_template("faq/index.html", faqs=faqs, categories=categories)
+    return render_template(
+        "faq/index.html",
+        page=page,
+        category_tree=category_tree,
+        category=category,
+        subtree=subtree,
+    )
+
+
+# Display a single note with its full content
+@bp.route("/<int:id>")
+@login_required
+@conditional_get
+def show_note(id):
+    note = db.session.execute(select_notes(content=True).where(Note.id == id)).scalar()
+
+    if note is None:
+        abort(404, "Note doesn't exist.")
+
+    return render_template("faq/show.html", note=note)
 
 
 # Add new note
@@ -77,14 +118,17 @@ def add_note():
             note = Note(
                 title=note_title,
                 category=cat,
-                content=note_content,
                 author_id=g.user.id,
+                **content_columns(note_content),
             )
             db.session.add(note)
+            adjust_note_counts({cat: 1})
+            bump_version(NOTE_VERSION)
             db.session.commit()
+            get_typeahead_index().set("note", note.id, note_title)
             return redirect(url_for("faq.index"))
 
-    categories = build_category_tree(load_categories())
+    categories = get_category_tree().roots
     return render_template("faq/add.html", categories=categories)
 
 
@@ -108,14 +152,25 @@ def update_note(id):
         if error is not None:
             flash(error)
         else:
+            # Concurrent edits of the note take turns, each one sees the last
+            lock_database()
+            note = get_note(id)
+
+            if int(cat) != note.category:
+                adjust_note_counts({note.category: -1, cat: 1})
+
+            record_revision(note, note_title, note_content, g.user.id)
+
             note.title = note_title
-            note.content = note_content
+            set_note_content(note, note_content)
             note.category = cat
             note.update_date = datetime.now()
+            bump_version(NOTE_VERSION)
             db.session.commit()
+            get_typeahead_index().set("note", id, note_title)
             return redirect(url_for("faq.index"))
 
-    categories = build_category_tree(load_categories())
+    categories = get_category_tree().roots
     return render_template("faq/update.html", note=note, categories=categories)
 
 
@@ -127,16 +182,127 @@ def delete_note(id):
     note = get_note(id)
 
     db.session.delete(note)
+    adjust_note_counts({note.category: -1})
+    bump_version(NOTE_VERSION)
     db.session.commit()
+    get_typeahead_index().remove("note", [id])
     return redirect(url_for("faq.index"))
 
 
+# Move or delete the notes selected in a note list
+@bp.route("/bulk", methods=("POST",))
+@login_required
+@level_required(2)
+def bulk_notes():
+    note_ids = request.form.getlist("note_ids", type=int)
+    action = request.form.get("action")
+    category_id = request.form.get("cat_selection", type=int)
+
+    try:
+        count = bulk_update_notes(note_ids, action, category_id)
+    except HTTPException as error:
+        db.session.rollback()
+        flash(error.description)
+    else:
+        db.session.commit()
+
+        if action == "move":
+            category = get_category_tree().by_id[category_id]
+            flash(f"Moved {count} notes to {category.name}.")
+        else:
+            flash(f"Deleted {count} notes.")
+
+    # Back to the list the notes were selected on
+    next_url = request.form.get("next", "")
+    if not next_url.startswith("/") or next_url.startswith("//"):
+        next_url = url_for("faq.index")
+    return redirect(next_url)
+
+
+# List saved versions of a note
+@bp.route("/<int:id>/history")
+@login_required
+@conditional_get
+def note_history(id):
+    note = get_note(id, check_author=False)
+
+    revisions = db.session.execute(
+        db.select(
+            NoteRevision.number,
+            NoteRevision.create_date,
+            NoteRevision.title,
+            NoteRevision.snapshot,
+            NoteRevision.content_size,
+            User.name.label("author"),
+        )
+        .outerjoin(User, User.id == NoteRevision.author_id)
+        .where(NoteRevision.note_id == id)
+        .order_by(NoteRevision.number.desc())
+    ).all()
+
+    return render_template("faq/history.html", note=note, revisions=revisions)
+
+
+# Show one version of a note and what changed since the version before it
+@bp.route("/<int:id>/history/<int:number>")
+@login_required
+@conditional_get
+def note_revision(id, number):
+    note = get_note(id, check_author=False)
+
+    versions = rebuild_revisions(id, number, keep=2)
+    if not versions or versions[-1][0] != number:
+        abort(404, "Revision doesn't exist.")
+
+    _, title, content = versions[-1]
+    if len(versions) > 1:
+        _, previous_title, previous_content = versions[0]
+    else:
+        previous_title, previous_content = title, ""
+
+    return render_template(
+        "faq/revision.html",
+        note=note,
+        number=number,
+        title=title,
+        content=content,
+        title_changed=title != previous_title,
+        diff=diff_lines(previous_content, content),
+    )
+
+
+# Put an older version back, saved as a new revision
+@bp.route("/<int:id>/history/<int:number>/restore", methods=("POST",))
+@login_required
+@level_required(2)
+def restore_revision(id, number):
+    lock_database()
+    note = get_note(id)
+
+    versions = rebuild_revisions(id, number)
+    if not versions or versions[-1][0] != number:
+        abort(404, "Revision doesn't exist.")
+
+    _, title, content = versions[-1]
+    record_revision(note, title, content, g.user.id)
+    note.title = title
+    set_note_content(note, content)
+    note.update_date = datetime.now()
+    bump_version(NOTE_VERSION)
+    db.session.commit()
+    get_typeahead_index().set("note", id, title)
+
+    flash(f"Restored revision {number}.")
+    return redirect(url_for("faq.note_history", id=id))
+
+
 # Category management
 @bp.route("/cat/manage")
 @login_required
 @level_required(3)
+@conditional_get
 def manage_categories():
-    categories = load_categories()
+    categories = get_category_tree().flat
 
     return render_template("category/manage.html", categories=categories)
 
@@ -165,43 +331,14 @@ def add_category():
             error = f"Category named '{new_category_name}' already exists."
 
         if error is None:
-            # If no parent, find the highest tree index of top level categories
-            # As base for tree attribute for new category
-            if new_category_parent == "0":
-                current_tree = db.session.execute(
-                    db.select(Category.tree)
-                    .where(Category.level == 0)
-                    .order_by(Category.tree.desc())
-                ).scalar()
-
-                # Set the tree attribute of new category to be base + 1
-                new_category_tree = f"{(int(current_tree) + 1):03d}"
-                new_category_level = 0
-
             # If parent category was provided, find it
-            else:
-                parent = db.session.execute(
-                    db.select(Category).where(Category.id == new_category_parent)
-                ).scalar()
-
-                # Determine the base of tree attribute for the new category
+            parent = None
+            if new_category_parent != "0":
+                parent = get_category(new_category_parent)
 
-                # If parent has no subcategories, set base to 000
-                if parent.subcategory_count == 0:
-                    current_tree = "000"
-
-                # Otherwise set base to tree attribute highest value among parent's subcategories
-                else:
-                    current_tree = db.session.execute(
-                        db.select(Category.tree)
-                        .where(Category.tree.like(f"{parent.tree}___"))
-                        .order_by(Category.tree.desc())
-                    ).scalar()
-
-                # Set the tree attribute of new category to be base (last subcategory's tree) + 1
-                new_category_tree = f"{parent.tree}{(int(current_tree[-3:]) + 1):03d}"
-
-                new_category_level = parent.level + 1
+            # Take the next free key under the parent (or at the top level)
+            new_category_tree, new_category_level = allocate_tree(parent)
+            if parent is not None:
                 parent.subcategory_count += 1
 
             new_category = Category(
@@ -210,13 +347,15 @@ def add_category():
                 tree=new_category_tree,
             )
             db.session.add(new_category)
+            bump_version(CATEGORY_VERSION)
             db.session.commit()
+            get_typeahead_index().set("category", new_category.id, new_category_name)
 
             return redirect(url_for("faq.manage_categories"))
 
         flash(error)
 
-    categories = build_category_tree(load_categories())
+    categories = get_category_tree().roots
     return render_template("category/add.html", categories=categories)
 
 
@@ -242,7 +381,9 @@ def edit_category(id):
 
         if error is None:
             category.name = new_name
+            bump_version(CATEGORY_VERSION)
             db.session.commit()
+            get_typeahead_index().set("category", id, new_name)
 
             return redirect(url_for("faq.manage_categories"))
 
@@ -251,6 +392,53 @@ def edit_category(id):
     return render_template("category/rename.html", category=category)
 
 
+# Move category with all its subcategories under another parent
+@bp.route("/cat/<int:id>/move", methods=("GET", "POST"))
+@login_required
+@level_required(3)
+def move_category(id):
+    # General category has to stay at the top level, deleted categories' notes go there
+    if id == 1:
+        flash("This category cannot be moved")
+        return redirect(url_for("faq.manage_categories"))
+
+    category = get_category(id)
+
+    if request.method == "POST":
+        new_parent_id = request.form.get("cat_selection", type=int)
+        error = None
+
+        if new_parent_id is None:
+            error = "Please select one of the options."
+
+        if error is None:
+            new_parent = get_category(new_parent_id) if new_parent_id else None
+            name = category.name
+
+            try:
+                moved = move_subtree(category, new_parent)
+            except MoveError as e:
+                error = str(e)
+
+        if error is None:
+            bump_version(CATEGORY_VERSION)
+            db.session.commit()
+
+            flash(f"Moved category {name} with {moved - 1} subcategories.")
+            return redirect(url_for("faq.manage_categories"))
+
+        db.session.rollback()
+        flash(error)
+
+    # Only categories outside the moved subtree can become its parent
+    categories = [
+        node
+        for node in get_category_tree().flat
+        if not node.tree.startswith(category.tree)
+    ]
+    return render_template("category/move.html", category=category, categories=categories)
+
+
 # Delete existing category
 @bp.route("/cat/<int:id>/delete", methods=("GET", "POST"))
 @login_required
@@ -282,48 +470,51 @@ def delete_category(id):
             error = f'Unknown command "{keep_notes}"'
 
         if error is None:
-            # Get a list of category and all its subcategories,
-            # Then build a list of notes belonging to them
-            if category.subcategory_count != 0:
-                categories = (
-                    db.session.execute(
-                        db.select(Category).where(
-                            Category.tree.like(f"{category.tree}%")
-                        )
-                    )
-                    .scalars()
-                    .all()
-                )
-
-                notes = []
-                for cat in categories:
-                    notes_in_cat = db.session.execute(
-                        db.select(Note).where(Note.category == cat.id)
-                    ).scalars()
-
-                    if notes_in_cat is not None:
-                        notes += notes_in_cat
+            # The category and all its subcategories, as a range on the tree column
+            subtree = Category.in_subtree(category.tree)
+            subtree_ids = db.select(Category.id).where(subtree)
+
+            # Delete or move all notes in the subtree with a single statement
+            if keep_notes == "delete":
+                notes_query = db.delete(Note)
             else:
-                categories = category
-                notes = db.session.execute(
-                    db.select(Note).where(Note.category == categories.id)
-                ).scalars()
-
-            # If notes exist, edit or delete them
-            if notes is not None:
-                if keep_notes == "delete":
-                    for note in notes:
-                        db.session.delete(note)
-                    db.session.commit()
-                elif keep_notes == "keep":
-                    for note in notes:
-                        note.category = parent_category.id
-                    db.session.commit()
+                notes_query = db.update(Note).values(category=parent_category.id)
+
+            notes_count = db.session.execute(
+                notes_query.where(Note.category.in_(subtree_ids)),
+                execution_options={"synchronize_session": False},
+            ).rowcount
+
+            # Take the subtree's notes off the ancestors' counts,
+            # kept notes are counted again in the parent category
+            changes = {category.id: -notes_count}
+            if keep_notes == "keep":
+                changes[parent_category.id] = notes_count
+            adjust_note_counts(changes)
 
             # Delete the category and its subcategories
-            for cat in categories:
-                db.session.delete(cat)
+            categories_count = db.session.execute(
+                db.delete(Category).where(subtree),
+                execution_options={"synchronize_session": False},
+            ).rowcount
+
+            if category.level > 0:
+                parent_category.subcategory_count -= 1
+
+            # Report what happened to the subtree
+            summary = (
+                f"Deleted category {category.name} "
+                f"with {categories_count - 1} subcategories. "
+            )
+            if keep_notes == "delete":
+                flash(summary + f"Deleted {notes_count} notes.")
+            else:
+                flash(summary + f"Moved {notes_count} notes to {parent_category.name}.")
+
+            bump_version(CATEGORY_VERSION)
+            bump_version(NOTE_VERSION)
             db.session.commit()
+            get_typeahead_index().expire()
             return redirect(url_for("faq.manage_categories"))
 
         flash(error)
@@ -332,52 +523,106 @@ def delete_category(id):
     )
 
 
-# Query the database for categories
-def load_categories():
-    return (
-        db.session.execute(db.select(Category).order_by(Category.tree)).scalars().all()
+# Fragment cache statistics, for tuning FRAGMENT_CACHE_SIZE
+@bp.route("/cache/stats")
+@login_required
+@level_required(4)
+def cache_stats():
+    return jsonify(get_fragment_cache().stats())
+
+
+# Base query for note lists, loading authors and categories in the same SELECT.
+# Lists only show previews, so the content columns are left out unless asked for,
+# and touching them on a note loaded without them raises instead of querying.
+def select_notes(content=False):
+    query = (
+        db.select(Note)
+        .join(Note.author)
+        .join(Note.category_name)
+        .options(contains_eager(Note.author), contains_eager(Note.category_name))
     )
+    if not content:
+        query = query.options(
+            defer(Note.content, raiseload=True),
+            defer(Note.content_html, raiseload=True),
+        )
+    return query
 
 
-# Build the category tree for display
-def build_category_tree(categories):
-    # Create a dictionary of categories for reference, based on tree column
-    tree_dict = {category.tree: category for category in categories}
+# Get a note by ID, only if the current user may edit it unless check_author is False
+def get_note(id, check_author=True):
+    note = db.session.execute(
+        db.select(Note, User.name).join(User).where(Note.id == id)
+    ).scalar()
 
-    # Create a list of top level categories
-    top_level_categories = []
+    if note is None:
+        abort(404, "Note doesn't exist.")
 
-    # Ensure each category has a subcategory attribute
-    for category in categories:
-        if not category.subcategories:
-            category.subcategories = []
+    if check_author and note.author_id != g.user.id and g.user.permission_level < 3:
+        abort(403, "You can only edit your own notes.")
 
-    # Build the category tree
-    for category in categories:
-        if category.level == 0:
-            # Append top-level categories to the list
-            top_level_categories.append(category)
-        else:
-            # Append subcategories to the proper parent
-            parent_tree = category.get_parent_tree()
-            tree_dict[parent_tree].subcategories.append(category)
+    return note
 
-    return top_level_categories
 
+# Move notes to another category ("move") or delete them ("delete"), with one
+# statement for the whole selection. Permissions are checked for all notes
+# with a single query and the same rules as get_note, nothing is changed
+# unless the user may edit every note. Returns the number of notes changed,
+# the caller commits, deleted notes leave the typeahead index with the commit.
+def bulk_update_notes(note_ids, action, category_id=None):
+    note_ids = set(note_ids)
+    if action not in ("move", "delete"):
+        abort(400, f'Unknown action "{action}".')
+    if not note_ids:
+        abort(400, "Select at least one note.")
+    if len(note_ids) > current_app.config["BULK_MAX_NOTES"]:
+        abort(400, f"Select at most {current_app.config['BULK_MAX_NOTES']} notes.")
+
+    if action == "move" and category_id not in get_category_tree().by_id:
+        abort(404, "Category doesn't exist.")
 
-# Get a note by ID
-def get_note(id):
-    note = db.session.execute(
-        db.select(Note, User.name).join(User).where(Note.id == id)
-    ).scalar()
+    rows = db.session.execute(
+        db.select(Note.id, Note.category, Note.author_id).where(Note.id.in_(note_ids))
+    ).all()
 
-    if note is None:
+    if len(rows) < len(note_ids):
         abort(404, "Note doesn't exist.")
 
-    if note.author_id != g.user.id and g.user.permission_level < 3:
+    if g.user.permission_level < 3 and any(
+        row.author_id != g.user.id for row in rows
+    ):
         abort(403, "You can only edit your own notes.")
 
-    return note
+    if action == "move":
+        rows = [row for row in rows if row.category != category_id]
+        statement = db.update(Note).values(
+            category=category_id, update_date=datetime.now()
+        )
+    else:
+        statement = db.delete(Note)
+
+    if not rows:
+        return 0
+
+    changes = Counter()
+    for row in rows:
+        changes[row.category] -= 1
+    if action == "move":
+        changes[category_id] += len(rows)
+    adjust_note_counts(changes)
+
+    count = db.session.execute(
+        statement.where(Note.id.in_([row.id for row in rows])),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    bump_version(NOTE_VERSION)
+
+    if action == "delete":
+        after_commit(
+            partial(get_typeahead_index().remove, "note", [row.id for row in rows])
+        )
+
+    return count
 
 
 # Get a category by ID
@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+
+from flask import current_app, render_template, url_for
+from markupsafe import Markup
+
+# Placeholder in cached note fragments, replaced by the per-user Edit link
+EDIT_LINK_SLOT = "<!--edit-link-->"
+
+
+# Bounded LRU cache of rendered HTML fragments, shared by all users.
+# Size is tracked in characters of cached HTML.
+class FragmentCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        with self.lock:
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = Markup(render())
+        if len(html) > self.max_size:
+            return html
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = html
+                self.size += len(html)
+                while self.size > self.max_size:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.size -= len(evicted)
+                    self.evictions += 1
+
+        return html
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size": self.size,
+                "max_size": self.max_size,
+            }
+
+
+def get_fragment_cache():
+    return current_app.extensions["faqapp.fragments"]
+
+
+# Render a note article, with the Edit link added for users allowed to edit it.
+# Lists show the stored preview, full=True the whole content.
+# The fragment depends on everything displayed: update_date covers title,
+# content and category changes, render_version re-rendered content,
+# author and category names cover renames.
+def note_fragment(note, editable, full=False):
+    key = (
+        "note",
+        note.id,
+        note.update_date,
+        note.render_version,
+        note.author.name,
+        note.category_name.name,
+        full,
+    )
+    html = get_fragment_cache().get_or_render(
+        key, lambda: render_template("faq/note.html", note=note, full=full)
+    )
+
+    edit_link = ""
+    if editable:
+        edit_link = Markup(
+            '<a href="{}" class="action alignright">Edit</a>'
+        ).format(url_for("faq.update_note", id=note.id))
+
+    return Markup(html.replace(EDIT_LINK_SLOT, edit_link, 1))
+
+
+# Render the category sidebar once per category version
+def sidebar_fragment(category_tree):
+    return get_fragment_cache().get_or_render(
+        ("sidebar", category_tree.version),
+        lambda: render_template("faq/sidebar.html", categories=category_tree.roots),
+    )
+
+
+def init_fragment_cache(app):
+    app.extensions["faqapp.fragments"] = FragmentCache(app.config["FRAGMENT_CACHE_SIZE"])
+    app.add_template_global(note_fragment)
+    app.add_template_global(sidebar_fragment)
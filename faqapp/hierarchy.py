@@ -0,0 +1,105 @@
+from sqlalchemy import func, literal
+
+from faqapp.counts import adjust_subtree_counts
+from faqapp.extensions import db
+from faqapp.models import Category, Counter, tree_keys, tree_segment
+
+# Counter holding the key for the next top level category
+ROOT_CATEGORY_KEY = "category_root_key"
+
+
+# Raised when a category can't be moved to the requested parent
+class MoveError(Exception):
+    pass
+
+
+# Allocate the tree and level for a new child of parent, None for top level.
+# Takes the next key from a counter with a single UPDATE, without looking at
+# the existing siblings. The caller adds the category and commits.
+def allocate_tree(parent):
+    if parent is None:
+        key = next_root_key()
+        return tree_segment(key), 0
+
+    key = db.session.execute(
+        db.update(Category)
+        .where(Category.id == parent.id)
+        .values(next_child_key=Category.next_child_key + 1)
+        .returning(Category.next_child_key),
+        execution_options={"synchronize_session": False},
+    ).scalar() - 1
+    db.session.expire(parent, ["next_child_key"])
+
+    return parent.tree + tree_segment(key), parent.level + 1
+
+
+def next_root_key():
+    key = db.session.execute(
+        db.update(Counter)
+        .where(Counter.name == ROOT_CATEGORY_KEY)
+        .values(value=Counter.value + 1)
+        .returning(Counter.value)
+    ).scalar()
+    if key is not None:
+        return key - 1
+
+    # First top level category since the counter was introduced
+    key = next_root_key_value()
+    db.session.add(Counter(name=ROOT_CATEGORY_KEY, value=key + 1))
+    return key
+
+
+# Key the next top level category will get, without allocating it
+def next_root_key_value():
+    key = db.session.execute(
+        db.select(Counter.value).where(Counter.name == ROOT_CATEGORY_KEY)
+    ).scalar()
+    if key is not None:
+        return key
+
+    roots = db.session.execute(
+        db.select(Category.tree).where(Category.level == 0)
+    ).scalars()
+    return max((tree_keys(tree)[0] + 1 for tree in roots), default=0)
+
+
+# Move a category with all its subcategories under new_parent, None for top level.
+# The whole subtree is rewritten by one UPDATE replacing the tree prefix,
+# notes keep their category ids. Returns the number of categories moved,
+# the caller bumps the category version and commits.
+def move_subtree(category, new_parent):
+    if new_parent is not None and new_parent.tree.startswith(category.tree):
+        raise MoveError("A category can't be moved into its own subcategory.")
+
+    old_parent = category.get_parent() if category.level > 0 else None
+    if old_parent == new_parent:
+        raise MoveError(f"Category {category.name} is already there.")
+
+    old_tree = category.tree
+    new_tree, new_level = allocate_tree(new_parent)
+
+    # The subtree's notes leave the old ancestors' counts for the new ones
+    moved_notes = {}
+    if old_parent is not None:
+        moved_notes[old_parent.tree] = -category.subtree_note_count
+    if new_parent is not None:
+        moved_notes[new_parent.tree] = category.subtree_note_count
+    adjust_subtree_counts(moved_notes)
+
+    moved = db.session.execute(
+        db.update(Category)
+        .where(Category.in_subtree(old_tree))
+        .values(
+            tree=literal(new_tree).concat(func.substr(Category.tree, len(old_tree) + 1)),
+            level=Category.level + (new_level - category.level),
+        ),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+    if old_parent is not None:
+        old_parent.subcategory_count -= 1
+    if new_parent is not None:
+        new_parent.subcategory_count += 1
+    db.session.expire(category, ["tree", "level"])
+
+    return moved
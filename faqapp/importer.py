@@ -0,0 +1,416 @@
+import functools
+import os
+import zipfile
+from collections import Counter
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+import click
+from flask import (
+    Blueprint,
+    current_app,
+    flash,
+    g,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from faqapp.auth import login_required, level_required
+from faqapp.content import content_columns
+from faqapp.counts import adjust_note_counts
+from faqapp.extensions import db
+from faqapp.hierarchy import ROOT_CATEGORY_KEY, next_root_key_value
+from faqapp.typeahead import get_typeahead_index
+from faqapp.models import (
+    MAX_TREE_KEY,
+    Note,
+    User,
+    Category,
+    parent_tree,
+    tree_segment,
+)
+from faqapp.versions import CATEGORY_VERSION, NOTE_VERSION, bump_version, set_version
+
+bp = Blueprint("importer", __name__, cli_group=None)
+
+# Files picked up by the importer, "" allows files without an extension
+TEXT_SUFFIXES = {".txt", ".md", ".faq", ""}
+# File names that say nothing about the note, the folder name is used instead
+GENERIC_NAMES = {"faq", "readme", "notes"}
+# Conflicting files named in the import summary
+MAX_LISTED_CONFLICTS = 10
+
+
+# Legacy text file found in a directory tree or a zip archive
+class SourceFile(NamedTuple):
+    folders: tuple
+    name: str
+    path: str
+    size: int
+    modified: datetime
+    open: Callable
+
+
+# Raised when the source can't be mapped onto the category tree
+class ImportAborted(Exception):
+    pass
+
+
+class ImportResult(NamedTuple):
+    categories: int
+    imported: int
+    existing: int
+    too_large: int
+    conflicts: list
+
+
+# Import legacy FAQ files from a zip archive upload
+@bp.route("/import", methods=("GET", "POST"))
+@login_required
+@level_required(4)
+def import_files():
+    if request.method == "POST":
+        upload = request.files.get("archive")
+        error = None
+
+        if not upload or not upload.filename:
+            error = "Please choose a zip archive."
+        else:
+            try:
+                with zipfile.ZipFile(upload.stream) as archive:
+                    result = import_sources(
+                        os.path.basename(upload.filename.replace("\\", "/")),
+                        lambda: walk_zip(archive),
+                        author_id=g.user.id,
+                    )
+            except (zipfile.BadZipFile, ImportAborted) as e:
+                error = str(e) or "Could not read the archive."
+
+        if error is None:
+            flash(describe_result(result))
+            return redirect(url_for("faq.manage_categories"))
+
+        flash(error)
+
+    return render_template("import/upload.html")
+
+
+# Import legacy FAQ files from a directory or a zip archive
+@bp.cli.command("import-faq")
+@click.argument("path", type=click.Path(exists=True))
+@click.option("--author", default=None, help="Username to author imported notes.")
+@click.option("--batch-size", type=int, default=None, help="Notes per transaction.")
+def import_command(path, author, batch_size):
+    author_name = author or current_app.config["ADMIN_USER"]
+    author_id = db.session.execute(
+        db.select(User.id).where(User.name == author_name)
+    ).scalar()
+    if author_id is None:
+        raise click.ClickException(f"User {author_name} doesn't exist.")
+
+    root = os.path.basename(os.path.abspath(path))
+    try:
+        if os.path.isdir(path):
+            result = import_sources(
+                root, lambda: walk_directory(path), author_id, batch_size
+            )
+        else:
+            with zipfile.ZipFile(path) as archive:
+                result = import_sources(
+                    root, lambda: walk_zip(archive), author_id, batch_size
+                )
+    except (zipfile.BadZipFile, ImportAborted) as e:
+        raise click.ClickException(str(e))
+
+    click.echo(describe_result(result))
+
+
+# Import files in two streaming passes over the source.
+# The first pass only lists folders and creates the missing categories in bulk,
+# the second reads files one at a time and inserts notes in batches.
+# Each note remembers its source, the name of the directory or archive (root)
+# and the file's path in it, so running the same import again, or resuming
+# an interrupted one, skips notes that are already there. A file whose note
+# exists with different content isn't imported either, it's reported as a
+# conflict, since the note may have been edited after the import.
+def import_sources(root, walk, author_id, batch_size=None):
+    batch_size = batch_size or current_app.config["IMPORT_BATCH_SIZE"]
+    max_size = current_app.config["IMPORT_MAX_FILE_SIZE"]
+
+    folders = {source.folders for source in walk() if source.folders}
+    category_ids, categories_created = ensure_categories(folders)
+
+    # Returns the category of every note actually inserted, for the note counts
+    insert_notes = (
+        sqlite_insert(Note.__table__)
+        .on_conflict_do_nothing(index_elements=["source"])
+        .returning(Note.__table__.c.category)
+    )
+
+    imported = existing = too_large = 0
+    conflicts = []
+    batch = []
+
+    def flush():
+        nonlocal imported, existing
+        if not batch:
+            return
+
+        # Notes imported from these files before, also under the bare paths
+        # stored before the root was part of the source
+        stored = dict(
+            db.session.execute(
+                db.select(Note.source, Note.content).where(
+                    Note.source.in_(
+                        [row["source"] for path, row in batch]
+                        + [path for path, row in batch]
+                    )
+                )
+            ).all()
+        )
+
+        rows = []
+        for path, row in batch:
+            if row["source"] in stored:
+                if stored[row["source"]] == row["content"]:
+                    existing += 1
+                else:
+                    conflicts.append(row["source"])
+            elif path in stored and stored[path] == row["content"]:
+                existing += 1
+            else:
+                rows.append(row)
+
+        # Rows inserted meanwhile by another import are skipped as existing
+        if rows:
+            added = Counter(db.session.execute(insert_notes, rows).scalars())
+            adjust_note_counts(added)
+            bump_version(NOTE_VERSION)
+            db.session.commit()
+            imported += sum(added.values())
+            existing += len(rows) - sum(added.values())
+        batch.clear()
+
+    for source in walk():
+        if source.size > max_size:
+            too_large += 1
+            continue
+
+        with source.open() as file:
+            content = decode_text(file.read())
+
+        batch.append(
+            (
+                source.path,
+                {
+                    "title": note_title(source),
+                    **content_columns(content),
+                    "category": category_ids.get(source.folders, 1),
+                    "author_id": author_id,
+                    "create_date": source.modified,
+                    "update_date": source.modified,
+                    "source": f"{root}:{source.path}",
+                },
+            )
+        )
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+    get_typeahead_index().expire()
+    return ImportResult(categories_created, imported, existing, too_large, conflicts)
+
+
+# Map folder paths to categories, creating missing ones with a few bulk statements.
+# Top level folders become top level categories, files outside any folder go to General.
+def ensure_categories(folders):
+    rows = db.session.execute(
+        db.select(Category.id, Category.name, Category.tree, Category.next_child_key)
+    ).all()
+
+    names_in_use = {row.name for row in rows}
+    children = {}
+    next_key = {"": next_root_key_value()}
+    for row in rows:
+        children.setdefault(parent_tree(row.tree), {})[row.name] = row.tree
+        next_key[row.tree] = row.next_child_key
+
+    trees = {(): ""}
+    new_categories = []
+    added_children = {}
+
+    # Parents sort before their children
+    for path in sorted(folders, key=lambda path: (len(path), path)):
+        for depth in range(1, len(path) + 1):
+            folder_path = path[:depth]
+            if folder_path in trees:
+                continue
+
+            parent = trees[folder_path[:-1]]
+            name = folder_path[-1][:40]
+            siblings = children.setdefault(parent, {})
+
+            # Category names are unique, so a folder whose name is taken
+            # elsewhere in the tree gets its parent's name appended
+            parent_name = folder_path[-2] if depth > 1 else None
+            alternative = f"{name} ({parent_name})"[:40] if parent_name else None
+
+            if name in siblings:
+                trees[folder_path] = siblings[name]
+                continue
+            if alternative in siblings:
+                trees[folder_path] = siblings[alternative]
+                continue
+
+            if name in names_in_use:
+                if alternative is None or alternative in names_in_use:
+                    raise ImportAborted(f"Category named '{name}' already exists.")
+                name = alternative
+
+            key = next_key.get(parent, 1)
+            if key > MAX_TREE_KEY:
+                raise ImportAborted(
+                    f"Too many subcategories for folder '{'/'.join(folder_path[:-1])}'."
+                )
+            next_key[parent] = key + 1
+
+            tree = parent + tree_segment(key)
+            trees[folder_path] = tree
+            siblings[name] = tree
+            names_in_use.add(name)
+            new_categories.append(
+                {
+                    "name": name,
+                    "level": depth - 1,
+                    "tree": tree,
+                    "subcategory_count": 0,
+                    "next_child_key": 1,
+                }
+            )
+            if parent:
+                added_children[parent] = added_children.get(parent, 0) + 1
+
+    if new_categories:
+        db.session.execute(db.insert(Category), new_categories)
+
+        # Parents get the new children counted and their next keys advanced,
+        # including parents created above, whose children were added after them
+        category_table = Category.__table__
+        if added_children:
+            db.session.execute(
+                category_table.update()
+                .where(category_table.c.tree == bindparam("parent_tree"))
+                .values(
+                    subcategory_count=category_table.c.subcategory_count
+                    + bindparam("added"),
+                    next_child_key=bindparam("next_key"),
+                ),
+                [
+                    {"parent_tree": tree, "added": added, "next_key": next_key[tree]}
+                    for tree, added in added_children.items()
+                ],
+            )
+        set_version(ROOT_CATEGORY_KEY, next_key[""])
+
+        bump_version(CATEGORY_VERSION)
+        db.session.commit()
+
+    ids_by_tree = dict(
+        db.session.execute(
+            db.select(Category.tree, Category.id).where(
+                Category.tree.in_([trees[path] for path in folders])
+            )
+        ).all()
+    )
+    category_ids = {path: ids_by_tree[trees[path]] for path in folders}
+
+    return category_ids, len(new_categories)
+
+
+def walk_directory(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+
+        relative = os.path.relpath(dirpath, root)
+        folders = () if relative == os.curdir else tuple(relative.split(os.sep))
+
+        for filename in sorted(filenames):
+            if not is_text_file(filename):
+                continue
+
+            full_path = os.path.join(dirpath, filename)
+            stat = os.stat(full_path)
+            yield SourceFile(
+                folders,
+                filename,
+                "/".join(folders + (filename,)),
+                stat.st_size,
+                datetime.fromtimestamp(stat.st_mtime).replace(microsecond=0),
+                functools.partial(open, full_path, "rb"),
+            )
+
+
+def walk_zip(archive):
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+
+        parts = tuple(part for part in info.filename.split("/") if part)
+        if any(part.startswith((".", "__MACOSX")) for part in parts):
+            continue
+        if not is_text_file(parts[-1]):
+            continue
+
+        yield SourceFile(
+            parts[:-1],
+            parts[-1],
+            "/".join(parts),
+            info.file_size,
+            datetime(*info.date_time),
+            functools.partial(archive.open, info),
+        )
+
+
+def is_text_file(filename):
+    return not filename.startswith(".") and (
+        os.path.splitext(filename)[1].lower() in TEXT_SUFFIXES
+    )
+
+
+def note_title(source):
+    title = os.path.splitext(source.name)[0]
+    if title.lower() in GENERIC_NAMES and source.folders:
+        title = source.folders[-1]
+    return title[:300]
+
+
+# Legacy files are mostly UTF-8, older ones were saved by Windows editors
+def decode_text(data):
+    for encoding in ("utf-8-sig", "cp1250"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("latin-1")
+
+
+def describe_result(result):
+    message = (
+        f"Created {result.categories} categories, imported {result.imported} notes, "
+        f"skipped {result.existing} already imported."
+    )
+    if result.too_large:
+        message += f" Skipped {result.too_large} files over the size limit."
+    if result.conflicts:
+        listed = ", ".join(result.conflicts[:MAX_LISTED_CONFLICTS])
+        if len(result.conflicts) > MAX_LISTED_CONFLICTS:
+            listed += f" and {len(result.conflicts) - MAX_LISTED_CONFLICTS} more"
+        message += (
+            f" Skipped {len(result.conflicts)} files that differ from the notes "
+            f"imported from them before: {listed}."
+        )
+    return message
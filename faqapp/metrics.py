@@ -0,0 +1,256 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+
+from flask import (
+    abort,
+    Blueprint,
+    current_app,
+    g,
+    has_request_context,
+    request,
+    Response,
+    before_render_template,
+    template_rendered,
+)
+from sqlalchemy import event
+
+from faqapp.extensions import db
+
+bp = Blueprint("metrics", __name__)
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 10_000_000)
+
+
+# Cumulative histogram per label value, in the Prometheus exposition format
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label, value):
+        counts, total = self.series.get(label, (None, 0.0))
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+        counts[bisect_left(self.buckets, value)] += 1
+        self.series[label] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{endpoint="{label}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{{endpoint="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{endpoint="{label}"}} {cumulative}')
+        return lines
+
+
+# Per-process metrics for every endpoint
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = (
+            Histogram(
+                "faqapp_request_duration_seconds",
+                "Time spent handling requests.",
+                DURATION_BUCKETS,
+            ),
+            Histogram(
+                "faqapp_sql_duration_seconds",
+                "Time spent in SQL statements per request.",
+                DURATION_BUCKETS,
+            ),
+            Histogram(
+                "faqapp_template_duration_seconds",
+                "Time spent rendering templates per request.",
+                DURATION_BUCKETS,
+            ),
+            Histogram(
+                "faqapp_sql_queries",
+                "SQL statements executed per request.",
+                QUERY_BUCKETS,
+            ),
+            Histogram(
+                "faqapp_response_size_bytes",
+                "Size of response bodies.",
+                SIZE_BUCKETS,
+            ),
+        )
+
+    def observe(self, endpoint, *values):
+        with self.lock:
+            for histogram, value in zip(self.histograms, values):
+                if value is not None:
+                    histogram.observe(endpoint, value)
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for histogram in self.histograms:
+                lines += histogram.render()
+        return lines
+
+
+# Measurements collected while handling a single request
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.template_started = 0.0
+
+
+def current_timings():
+    if has_request_context():
+        return g.get("timings")
+    return None
+
+
+# The start time is kept on the statement's execution context,
+# which goes away with the statement whether it succeeds or fails
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.faqapp_query_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.faqapp_query_started
+
+    threshold = current_app.config["SLOW_QUERY_THRESHOLD_MS"]
+    if threshold is not None and elapsed * 1000 >= threshold:
+        current_app.logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+    timings = current_timings()
+    if timings is None:
+        return
+
+    timings.query_count += 1
+    timings.sql_time += elapsed
+    if elapsed > timings.slowest_time:
+        timings.slowest_time = elapsed
+        timings.slowest_statement = statement
+
+
+# Templates render each other (fragments), only time the outermost one
+def template_started(sender, template, context, **extra):
+    timings = current_timings()
+    if timings is not None:
+        if timings.template_depth == 0:
+            timings.template_started = time.perf_counter()
+        timings.template_depth += 1
+
+
+def template_finished(sender, template, context, **extra):
+    timings = current_timings()
+    if timings is not None and timings.template_depth > 0:
+        timings.template_depth -= 1
+        if timings.template_depth == 0:
+            timings.template_time += time.perf_counter() - timings.template_started
+
+
+def start_request():
+    g.timings = RequestTimings()
+
+
+# Report the request's timings in a Server-Timing header and record them
+def finish_request(response):
+    timings = current_timings()
+    if timings is None:
+        return response
+
+    total = time.perf_counter() - timings.started
+    size = None if response.is_streamed else response.calculate_content_length()
+
+    response.headers["Server-Timing"] = ", ".join(
+        (
+            f'db;dur={timings.sql_time * 1000:.2f};desc="{timings.query_count} queries"',
+            f'slowest-query;dur={timings.slowest_time * 1000:.2f}',
+            f"tpl;dur={timings.template_time * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        )
+    )
+
+    current_app.logger.debug(
+        "%s %s: %d queries in %.1f ms, slowest %.1f ms: %s",
+        request.method,
+        request.full_path,
+        timings.query_count,
+        timings.sql_time * 1000,
+        timings.slowest_time * 1000,
+        timings.slowest_statement,
+    )
+
+    current_app.extensions["faqapp.metrics"].observe(
+        request.endpoint or "none",
+        total,
+        timings.sql_time,
+        timings.template_time,
+        timings.query_count,
+        size,
+    )
+    return response
+
+
+# Scrapers send METRICS_TOKEN as a bearer token, without one
+# the metrics are only shown to logged-in admins like /cache/stats
+def require_metrics_access():
+    token = current_app.config["METRICS_TOKEN"]
+    if token and hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()
+    ):
+        return
+
+    if g.user is None:
+        abort(401)
+    if g.user.permission_level < 4:
+        abort(403)
+
+
+# Prometheus scrape endpoint, metrics are per worker process
+@bp.route("/metrics")
+def metrics():
+    require_metrics_access()
+
+    lines = current_app.extensions["faqapp.metrics"].render()
+
+    stats = current_app.extensions["faqapp.fragments"].stats()
+    for name in ("hits", "misses", "evictions"):
+        lines.append(f"# TYPE faqapp_fragment_cache_{name}_total counter")
+        lines.append(f"faqapp_fragment_cache_{name}_total {stats[name]}")
+    lines.append("# TYPE faqapp_fragment_cache_size gauge")
+    lines.append(f"faqapp_fragment_cache_size {stats['size']}")
+
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+# The slow query log works on its own, request metrics need METRICS_ENABLED
+def init_metrics(app):
+    enabled = app.config["METRICS_ENABLED"]
+    if not enabled and app.config["SLOW_QUERY_THRESHOLD_MS"] is None:
+        return
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(db.engine, "after_cursor_execute", after_cursor_execute)
+
+    if not enabled:
+        return
+
+    app.extensions["faqapp.metrics"] = Metrics()
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.register_blueprint(bp)
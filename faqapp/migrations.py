@@ -0,0 +1,202 @@
+import click
+from flask import current_app
+from sqlalchemy import text
+
+from faqapp.content import backfill_previews
+from faqapp.counts import repair_note_counts
+from faqapp.extensions import db, lock_database
+from faqapp.hierarchy import ROOT_CATEGORY_KEY
+from faqapp.models import tree_segment
+from faqapp.revisions import REVISION_TRIGGER
+from faqapp.versions import SCHEMA_VERSION, get_version, set_version
+
+
+# Schema changes for existing databases, applied in order.
+# New databases get the same schema from db.create_all(), so every
+# migration has to be safe to run against tables that already match it.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return fn
+
+    return register
+
+
+@migration(1, "Indexes for note feeds, author lookups and category listings")
+def add_query_indexes():
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_note_create_date ON note (create_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_note_category_create_date "
+        "ON note (category, create_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_note_author_id ON note (author_id)",
+        "CREATE INDEX IF NOT EXISTS ix_category_level_tree ON category (level, tree)",
+        "CREATE INDEX IF NOT EXISTS ix_category_name ON category (name)",
+    ):
+        db.session.execute(text(statement))
+
+
+@migration(2, "Source path for imported notes")
+def add_note_source():
+    if not column_exists("note", "source"):
+        db.session.execute(text("ALTER TABLE note ADD COLUMN source VARCHAR"))
+    db.session.execute(
+        text("CREATE UNIQUE INDEX IF NOT EXISTS ix_note_source ON note (source)")
+    )
+
+
+@migration(3, "Variable length category tree keys and next subcategory keys")
+def reencode_category_trees():
+    # The column and the new trees are committed together, so a table that
+    # has the column (from this migration or db.create_all) is converted already
+    if column_exists("category", "next_child_key"):
+        return
+
+    db.session.execute(
+        text(
+            "ALTER TABLE category "
+            "ADD COLUMN next_child_key INTEGER NOT NULL DEFAULT 1"
+        )
+    )
+
+    rows = db.session.execute(text("SELECT id, tree FROM category")).all()
+    if not rows:
+        return
+
+    # Old trees have three digits per level
+    keys = {
+        row.id: [int(row.tree[i : i + 3]) for i in range(0, len(row.tree), 3)]
+        for row in rows
+    }
+    next_keys = {}
+    for path in keys.values():
+        parent = tuple(path[:-1])
+        next_keys[parent] = max(next_keys.get(parent, 0), path[-1] + 1)
+
+    # Move the old values out of the way first, some old and new trees are equal
+    db.session.execute(text("UPDATE category SET tree = '-' || tree"))
+    db.session.execute(
+        text(
+            "UPDATE category SET tree = :tree, next_child_key = :next_key "
+            "WHERE id = :id"
+        ),
+        [
+            {
+                "id": id,
+                "tree": "".join(tree_segment(key) for key in path),
+                "next_key": next_keys.get(tuple(path), 1),
+            }
+            for id, path in keys.items()
+        ],
+    )
+    set_version(ROOT_CATEGORY_KEY, next_keys.get((), 0))
+
+
+@migration(4, "Note counts per category and subtree")
+def add_category_note_counts():
+    for column in ("note_count", "subtree_note_count"):
+        if not column_exists("category", column):
+            db.session.execute(
+                text(
+                    f"ALTER TABLE category "
+                    f"ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"
+                )
+            )
+
+    repair_note_counts()
+
+
+@migration(5, "Note revision history cleanup trigger")
+def add_note_revision_trigger():
+    db.session.execute(text(REVISION_TRIGGER))
+
+
+@migration(6, "Stored note previews and content sizes")
+def add_note_previews():
+    if not column_exists("note", "preview"):
+        db.session.execute(
+            text("ALTER TABLE note ADD COLUMN preview VARCHAR NOT NULL DEFAULT ''")
+        )
+    if not column_exists("note", "content_size"):
+        db.session.execute(
+            text("ALTER TABLE note ADD COLUMN content_size INTEGER NOT NULL DEFAULT 0")
+        )
+
+    backfill_previews()
+
+
+# Existing notes are left at render_version 0, and rendered in the
+# background on startup or with "flask render-notes"
+@migration(7, "Stored content HTML with renderer version")
+def add_note_html():
+    for column, definition in (
+        ("content_html", "VARCHAR NOT NULL DEFAULT ''"),
+        ("preview_html", "VARCHAR NOT NULL DEFAULT ''"),
+        ("render_version", "INTEGER NOT NULL DEFAULT 0"),
+    ):
+        if not column_exists("note", column):
+            db.session.execute(
+                text(f"ALTER TABLE note ADD COLUMN {column} {definition}")
+            )
+
+    db.session.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_note_render_version "
+            "ON note (render_version, id)"
+        )
+    )
+
+
+# Schema version of a database with every migration applied
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def column_exists(table, column):
+    columns = db.session.execute(text(f"PRAGMA table_info({table})")).all()
+    return any(row.name == column for row in columns)
+
+
+# Apply all migrations newer than the stored schema version.
+# Each migration commits together with its version bump. The version is
+# read again after taking the write lock, so when several workers start on
+# an old database only the first one applies each migration.
+def run_migrations():
+    applied = []
+
+    for version, description, fn in MIGRATIONS:
+        if version <= get_version(SCHEMA_VERSION):
+            continue
+
+        try:
+            lock_database()
+            if version <= get_version(SCHEMA_VERSION):
+                db.session.rollback()
+                continue
+
+            fn()
+            set_version(SCHEMA_VERSION, version)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        current_app.logger.info("Applied migration %s: %s", version, description)
+        applied.append(version)
+
+    return applied
+
+
+# Upgrade the database schema to the latest version
+@click.command("migrate")
+def migrate_command():
+    applied = run_migrations()
+
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(map(str, applied))}.")
+    else:
+        version = get_version(SCHEMA_VERSION)
+        click.echo(f"Database is up to date (schema version {version}).")
@@ -1,6 +1,15 @@
 from datetime import datetime
-from typing import List
-from sqlalchemy import Integer, String, ForeignKey, func
+from typing import List, Optional
+from sqlalchemy import (
+    Boolean,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    ForeignKey,
+    and_,
+    func,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from faqapp.extensions import db
@@ -28,11 +37,104 @@ class Note(db.Model):
     )
     title: Mapped[str] = mapped_column(String(300), nullable=False)
     content: Mapped[str] = mapped_column(String)
+    # Start of the content shown in note lists, and the full content length,
+    # kept up to date by faqapp.content on every write
+    preview: Mapped[str] = mapped_column(
+        String, nullable=False, default="", server_default=""
+    )
+    content_size: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    # Content and preview rendered to HTML on write, by renderer render_version.
+    # 0 means not rendered yet, read paths fall back to the plain text.
+    content_html: Mapped[str] = mapped_column(
+        String, nullable=False, default="", server_default=""
+    )
+    preview_html: Mapped[str] = mapped_column(
+        String, nullable=False, default="", server_default=""
+    )
+    render_version: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
     category = mapped_column(ForeignKey("category.id"))
+    # Path of the legacy file a note was imported from, if any
+    source: Mapped[Optional[str]] = mapped_column(String, nullable=True)
 
     author: Mapped["User"] = relationship(back_populates="notes")
     category_name: Mapped["Category"] = relationship(back_populates="notes")
 
+    # Indexes matching the note feed, category feed and author lookups,
+    # and the search for notes rendered by an older renderer
+    __table_args__ = (
+        Index("ix_note_create_date", "create_date", "id"),
+        Index("ix_note_category_create_date", "category", "create_date", "id"),
+        Index("ix_note_author_id", "author_id"),
+        Index("ix_note_source", "source", unique=True),
+        Index("ix_note_render_version", "render_version", "id"),
+    )
+
+
+# Define note revision model, one row per saved version of an edited note.
+# Full snapshots are stored every REVISION_SNAPSHOT_INTERVAL revisions,
+# the revisions in between hold zlib-compressed deltas against the previous one.
+class NoteRevision(db.Model):
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    note_id = mapped_column(ForeignKey("note.id"), nullable=False)
+    number: Mapped[int] = mapped_column(Integer, nullable=False)
+    create_date: Mapped[datetime] = mapped_column(
+        insert_default=func.now(), nullable=False
+    )
+    author_id = mapped_column(ForeignKey("user.id"), nullable=True)
+    title: Mapped[str] = mapped_column(String(300), nullable=False)
+    snapshot: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    # Length of the content this revision rebuilds to
+    content_size: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_note_revision_note_number", "note_id", "number", unique=True),
+    )
+
+
+# Category trees are materialized paths with one segment per level.
+# A segment is a child key written as its digit count followed by its digits,
+# e.g. 0 -> "10", 7 -> "17", 42 -> "242", 1000 -> "41000". String order is
+# still tree order and no segment is a prefix of another, so a subtree
+# is a range on the tree column.
+MAX_TREE_KEY = 999999999
+
+
+def tree_segment(key):
+    if not 0 <= key <= MAX_TREE_KEY:
+        raise ValueError(f"Category key {key} out of range.")
+    digits = str(key)
+    return f"{len(digits)}{digits}"
+
+
+# Split a tree into its child keys, from the top level down
+def tree_keys(tree):
+    keys = []
+    position = 0
+    while position < len(tree):
+        length = int(tree[position])
+        keys.append(int(tree[position + 1 : position + 1 + length]))
+        position += 1 + length
+    return keys
+
+
+def parent_tree(tree):
+    return "".join(tree_segment(key) for key in tree_keys(tree)[:-1])
+
+
+# The tree itself and the trees of all its ancestors
+def ancestor_trees(tree):
+    trees = []
+    prefix = ""
+    for key in tree_keys(tree):
+        prefix += tree_segment(key)
+        trees.append(prefix)
+    return trees
+
 
 # Define category model
 class Category(db.Model):
@@ -41,15 +143,42 @@ class Category(db.Model):
     level: Mapped[int] = mapped_column(Integer, nullable=False)
     tree: Mapped[str] = mapped_column(String, nullable=False, unique=True)
     subcategory_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Key for the next subcategory, keys of deleted subcategories aren't reused
+    next_child_key: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=1, server_default="1"
+    )
+    # Notes in this category, and in this category and all its subcategories
+    note_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    subtree_note_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
 
     notes: Mapped[List["Note"]] = relationship(back_populates="category_name")
 
-    subcategories = []
+    # Indexes for top level category lookups and name checks
+    __table_args__ = (
+        Index("ix_category_level_tree", "level", "tree"),
+        Index("ix_category_name", "name"),
+    )
 
     def get_parent_tree(self):
-        return self.tree[:-3]
+        return parent_tree(self.tree)
+
+    # SQL condition matching a category tree and all of its descendants.
+    # Trees are digit strings, so descendants sort between tree and tree + ":"
+    @classmethod
+    def in_subtree(cls, tree):
+        return and_(cls.tree >= tree, cls.tree < tree + ":")
 
     def get_parent(self):
         return db.session.execute(
             db.select(Category).where(Category.tree == self.get_parent_tree())
         ).scalar()
+
+
+# Define version counter model, used to invalidate per-process caches
+class Counter(db.Model):
+    name: Mapped[str] = mapped_column(String(30), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
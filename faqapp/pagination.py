@@ -0,0 +1,94 @@
+import base64
+import binascii
+from typing import NamedTuple, Optional
+
+from flask import abort, current_app
+from sqlalchemy import String, tuple_, type_coerce
+
+from faqapp.extensions import db
+from faqapp.models import Note
+
+
+# One page of notes, plus cursors pointing at the neighbouring pages
+class NotePage(NamedTuple):
+    items: list
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+# Sort key used for keyset pagination.
+# create_date is compared as the raw stored string, so cursors round-trip
+# exactly regardless of how the timestamp was written (CURRENT_TIMESTAMP or Python)
+def note_sort_key():
+    return tuple_(type_coerce(Note.create_date, String), Note.id)
+
+
+def encode_cursor(create_date, note_id):
+    raw = f"{create_date}|{note_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        create_date, note_id = (
+            base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        )
+        return create_date, int(note_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(400, "Invalid page cursor.")
+
+
+# Paginate a select() of notes on (create_date, id), oldest first.
+# Only one of after / before should be given; neither means the first page.
+def paginate_notes(query, after=None, before=None, per_page=None):
+    if per_page is None:
+        per_page = current_app.config["NOTES_PER_PAGE"]
+
+    rows = db.session.execute(page_query(query, after, before, per_page)).all()
+    return make_page(rows, after, before, per_page)
+
+
+# Query for one page of notes, plus one row telling whether there are more
+def page_query(query, after, before, per_page):
+    sort_key = note_sort_key()
+    query = query.add_columns(
+        type_coerce(Note.create_date, String).label("cursor_date")
+    )
+
+    if before is not None:
+        query = query.where(sort_key < tuple_(*decode_cursor(before))).order_by(
+            Note.create_date.desc(), Note.id.desc()
+        )
+    else:
+        if after is not None:
+            query = query.where(sort_key > tuple_(*decode_cursor(after)))
+        query = query.order_by(Note.create_date, Note.id)
+
+    return query.limit(per_page + 1)
+
+
+# Turn the rows fetched by page_query() into a page with its cursors
+def make_page(rows, after, before, per_page):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    # Backward pages are fetched newest first, flip them back for display
+    if before is not None:
+        rows.reverse()
+
+    if not rows:
+        return NotePage([], None, None)
+
+    first, last = rows[0], rows[-1]
+    first_cursor = encode_cursor(first[-1], first[0].id)
+    last_cursor = encode_cursor(last[-1], last[0].id)
+
+    if before is not None:
+        next_cursor = last_cursor
+        prev_cursor = first_cursor if has_more else None
+    else:
+        next_cursor = last_cursor if has_more else None
+        prev_cursor = first_cursor if after is not None else None
+
+    return NotePage([row[0] for row in rows], next_cursor, prev_cursor)
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from flask import current_app
+
+from faqapp.extensions import after_commit, db
+from faqapp.models import User
+from faqapp.versions import USER_VERSION, bump_version, get_version
+
+
+# Snapshot of the logged-in user, used for g.user instead of the ORM object
+class Principal(NamedTuple):
+    id: int
+    name: str
+    permission_level: int
+
+
+# Per-process LRU cache of principals.
+# Entries are valid for one value of the user version counter, which is
+# re-read from the database at most once every PRINCIPAL_CACHE_TTL seconds.
+class PrincipalCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def current_version(self):
+        now = time.monotonic()
+        if self.version is None or now - self.checked_at >= self.ttl:
+            self.version = get_version(USER_VERSION)
+            self.checked_at = now
+        return self.version
+
+    def get(self, user_id):
+        version = self.current_version()
+
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[1] == version:
+                self.entries.move_to_end(user_id)
+                return entry[0]
+
+        row = db.session.execute(
+            db.select(User.id, User.name, User.permission_level).where(
+                User.id == user_id
+            )
+        ).first()
+        principal = Principal(*row) if row is not None else None
+
+        with self.lock:
+            self.entries[user_id] = (principal, version)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+        return principal
+
+    # Force the version to be re-read on the next lookup
+    def expire(self):
+        with self.lock:
+            self.entries.clear()
+            self.checked_at = 0.0
+
+
+def get_principal_cache():
+    cache = current_app.extensions.get("faqapp.principals")
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            "faqapp.principals",
+            PrincipalCache(
+                current_app.config["PRINCIPAL_CACHE_SIZE"],
+                current_app.config["PRINCIPAL_CACHE_TTL"],
+            ),
+        )
+    return cache
+
+
+def load_principal(user_id):
+    return get_principal_cache().get(user_id)
+
+
+# Call when a user's name or permissions change, or a user is deleted.
+# Takes effect in this process as soon as the caller commits, and within
+# PRINCIPAL_CACHE_TTL seconds in other worker processes. Expiring only after
+# the commit keeps concurrent requests from caching the old rows again under
+# the old version.
+def invalidate_principals():
+    bump_version(USER_VERSION)
+    after_commit(get_principal_cache().expire)
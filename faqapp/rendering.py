@@ -0,0 +1,79 @@
+import re
+
+from markupsafe import Markup, escape
+
+# Bump whenever the output of render_content changes, stored HTML of older
+# versions is re-rendered in the background (see faqapp.content)
+RENDERER_VERSION = 1
+
+# Lines opening or closing a code block, e.g. ``` or ```bash
+CODE_FENCE = re.compile(r"^```[\w+-]*[ \t]*$")
+
+# Inline formatting, in order of precedence: `code`, **bold**,
+# [text](http://link) and bare http(s) links
+INLINE = re.compile(
+    r"`(?P<code>[^`\n]+)`"
+    r"|\*\*(?P<bold>[^*\n]+)\*\*"
+    r"|\[(?P<text>[^\]\n]+)\]\((?P<href>https?://[^\s()]+)\)"
+    r"|(?P<url>https?://[^\s<>()\"']*[^\s<>()\"'.,;:!?])"
+)
+
+TEXT_BLOCK = Markup('<p class="textbody">{}</p>')
+CODE_BLOCK = Markup('<pre class="code"><code>{}</code></pre>')
+LINK = Markup('<a href="{}" rel="nofollow noopener">{}</a>')
+
+
+# Convert note content to HTML. Whitespace is kept as written, like the
+# plain text notes always were, with code blocks, inline code, bold text
+# and links on top. All text is escaped as it's copied to the output,
+# so the HTML can't contain anything the renderer didn't put there itself.
+def render_content(content):
+    html = []
+    text = []
+    code = None
+
+    def flush_text():
+        block = "\n".join(text).strip("\n")
+        if block.strip():
+            html.append(TEXT_BLOCK.format(render_inline(block)))
+        text.clear()
+
+    for line in content.split("\n"):
+        fence = CODE_FENCE.match(line.strip())
+        if code is None and fence:
+            flush_text()
+            code = []
+        elif code is None:
+            text.append(line)
+        elif fence:
+            html.append(CODE_BLOCK.format("\n".join(code)))
+            code = None
+        else:
+            code.append(line)
+
+    # An unclosed code block runs to the end, as in a cut off preview
+    if code is not None:
+        html.append(CODE_BLOCK.format("\n".join(code)))
+    flush_text()
+
+    return Markup("").join(html)
+
+
+def render_inline(text):
+    parts = []
+    position = 0
+
+    for match in INLINE.finditer(text):
+        parts.append(escape(text[position : match.start()]))
+        if match["code"] is not None:
+            parts.append(Markup("<code>{}</code>").format(match["code"]))
+        elif match["bold"] is not None:
+            parts.append(Markup("<strong>{}</strong>").format(match["bold"]))
+        elif match["href"] is not None:
+            parts.append(LINK.format(match["href"], match["text"]))
+        else:
+            parts.append(LINK.format(match["url"], match["url"]))
+        position = match.end()
+
+    parts.append(escape(text[position:]))
+    return Markup("").join(parts)
@@ -0,0 +1,183 @@
+import difflib
+import json
+import zlib
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func
+
+from faqapp.extensions import db
+from faqapp.models import NoteRevision
+
+# Revision rows go away with their note, including bulk deletes of
+# categories and users that never load the notes
+REVISION_TRIGGER = """CREATE TRIGGER IF NOT EXISTS note_revision_delete
+    AFTER DELETE ON note BEGIN
+        DELETE FROM note_revision WHERE note_id = old.id;
+    END"""
+
+
+# Save the edit about to be made to a note, before the new title and content
+# are assigned. The first edit of a note also saves the version it replaces.
+# Only the current note row is read on normal page views, history costs
+# nothing until it's looked at. The caller holds the write lock since before
+# the note was read (see lock_database), so the revision number and the
+# delta base can't be changed by a concurrent edit, and commits.
+def record_revision(note, new_title, new_content, author_id):
+    old_content = note.content or ""
+    new_content = new_content or ""
+    if note.title == new_title and old_content == new_content:
+        return
+
+    latest = db.session.execute(
+        db.select(func.max(NoteRevision.number)).where(
+            NoteRevision.note_id == note.id
+        )
+    ).scalar()
+
+    if latest is None:
+        latest = 1
+        db.session.add(
+            make_revision(
+                note.id,
+                latest,
+                note.author_id,
+                note.title,
+                old_content,
+                None,
+                note.update_date or note.create_date,
+            )
+        )
+
+    db.session.add(
+        make_revision(
+            note.id,
+            latest + 1,
+            author_id,
+            new_title,
+            new_content,
+            old_content,
+            datetime.now(),
+        )
+    )
+
+
+# Build a revision row, a snapshot every REVISION_SNAPSHOT_INTERVAL revisions
+# (and always for the first one), otherwise a delta against previous_content
+def make_revision(note_id, number, author_id, title, content, previous_content, date):
+    interval = current_app.config["REVISION_SNAPSHOT_INTERVAL"]
+    snapshot = previous_content is None or (number - 1) % interval == 0
+
+    if snapshot:
+        data = zlib.compress(content.encode(), 9)
+    else:
+        data = encode_delta(make_delta(previous_content, content))
+
+    return NoteRevision(
+        note_id=note_id,
+        number=number,
+        author_id=author_id,
+        title=title,
+        snapshot=snapshot,
+        data=data,
+        content_size=len(content),
+        create_date=date,
+    )
+
+
+# Line based delta: [start, end] copies lines of the previous version,
+# a string is inserted as is
+def make_delta(old, new):
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+
+    delta = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif j2 > j1:
+            delta.append("".join(new_lines[j1:j2]))
+    return delta
+
+
+def apply_delta(old, delta):
+    old_lines = old.splitlines(keepends=True)
+    return "".join(
+        "".join(old_lines[op[0] : op[1]]) if isinstance(op, list) else op
+        for op in delta
+    )
+
+
+def encode_delta(delta):
+    return zlib.compress(json.dumps(delta, separators=(",", ":")).encode(), 9)
+
+
+def decode_delta(data):
+    return json.loads(zlib.decompress(data))
+
+
+# Rebuild a note's versions up to revision number, starting from the closest
+# snapshot at or before it. Returns the last `keep` versions as
+# (number, title, content) tuples, oldest first.
+def rebuild_revisions(note_id, number, keep=1):
+    start = db.session.execute(
+        db.select(func.max(NoteRevision.number))
+        .where(NoteRevision.note_id == note_id)
+        .where(NoteRevision.number <= number)
+        .where(NoteRevision.snapshot)
+    ).scalar()
+    if start is None:
+        return []
+
+    # One revision before the snapshot is needed to diff against it
+    if keep > 1 and start > 1 and number == start:
+        start = db.session.execute(
+            db.select(func.max(NoteRevision.number))
+            .where(NoteRevision.note_id == note_id)
+            .where(NoteRevision.number < start)
+            .where(NoteRevision.snapshot)
+        ).scalar()
+
+    rows = db.session.execute(
+        db.select(
+            NoteRevision.number,
+            NoteRevision.title,
+            NoteRevision.snapshot,
+            NoteRevision.data,
+        )
+        .where(NoteRevision.note_id == note_id)
+        .where(NoteRevision.number.between(start, number))
+        .order_by(NoteRevision.number)
+    ).all()
+
+    versions = []
+    content = ""
+    for row in rows:
+        if row.snapshot:
+            content = zlib.decompress(row.data).decode()
+        else:
+            content = apply_delta(content, decode_delta(row.data))
+        versions.append((row.number, row.title, content))
+
+    return versions[-keep:]
+
+
+# Unified diff as (kind, line) pairs for the template
+def diff_lines(old, new):
+    lines = []
+    for line in difflib.unified_diff(
+        old.splitlines(), new.splitlines(), lineterm="", n=3
+    ):
+        if line.startswith(("---", "+++")):
+            continue
+        if line.startswith("@@"):
+            kind = "hunk"
+        elif line.startswith("+"):
+            kind = "added"
+        elif line.startswith("-"):
+            kind = "removed"
+        else:
+            kind = "context"
+        lines.append((kind, line))
+    return lines
@@ -0,0 +1,174 @@
+import click
+from flask import (
+    abort,
+    Blueprint,
+    current_app,
+    render_template,
+    request,
+)
+from markupsafe import escape, Markup
+from sqlalchemy import column, func, literal_column, table, text
+
+from faqapp.auth import login_required
+from faqapp.categories import get_category_tree
+from faqapp.extensions import db
+from faqapp.models import Note, User, Category
+
+bp = Blueprint("search", __name__, url_prefix="/search")
+
+# External content FTS5 table over note titles and bodies.
+# Triggers on the note table keep it in sync with every write,
+# including the bulk deletes done by category and user management.
+SEARCH_SCHEMA = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS note_fts USING fts5(
+        title, content,
+        content='note', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS note_fts_insert AFTER INSERT ON note BEGIN
+        INSERT INTO note_fts(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS note_fts_delete AFTER DELETE ON note BEGIN
+        INSERT INTO note_fts(note_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS note_fts_update AFTER UPDATE OF title, content ON note BEGIN
+        INSERT INTO note_fts(note_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO note_fts(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+)
+
+note_fts = table("note_fts", column("rowid"), column("title"), column("content"))
+fts_table = literal_column("note_fts")
+
+# Markers placed around matches by FTS5, swapped for <mark> after escaping
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+
+# Search notes
+@bp.route("/")
+@login_required
+def search():
+    if not search_available():
+        abort(501, "Search requires SQLite with FTS5.")
+
+    query = request.args.get("q", "").strip()
+    category_id = request.args.get("cat", type=int)
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = current_app.config["NOTES_PER_PAGE"]
+
+    category_tree = get_category_tree()
+    category = category_tree.by_id.get(category_id)
+
+    results = []
+    has_next = False
+    match = build_match_expression(query)
+
+    if match:
+        rows = db.session.execute(search_query(match, category, page, per_page)).all()
+        has_next = len(rows) > per_page
+        results = rows[:per_page]
+
+    return render_template(
+        "search/results.html",
+        query=query,
+        category=category,
+        categories=category_tree.roots,
+        results=results,
+        page=page,
+        has_next=has_next,
+    )
+
+
+# Ranked matches for one page of results, plus one row telling whether there are more
+def search_query(match, category, page, per_page):
+    stmt = (
+        db.select(
+            Note.id,
+            Note.create_date,
+            User.name.label("author"),
+            Category.id.label("category_id"),
+            Category.name.label("category"),
+            func.highlight(fts_table, 0, MATCH_START, MATCH_END).label("title"),
+            func.snippet(fts_table, 1, MATCH_START, MATCH_END, "…", 24).label(
+                "snippet"
+            ),
+        )
+        .select_from(note_fts)
+        .join(Note, Note.id == note_fts.c.rowid)
+        .join(Note.author)
+        .join(Note.category_name)
+        .where(fts_table.op("MATCH")(match))
+        # Title matches weigh more than content matches
+        .order_by(func.bm25(fts_table, 10.0, 1.0), Note.id)
+        .limit(per_page + 1)
+        .offset((page - 1) * per_page)
+    )
+
+    if category is not None:
+        stmt = stmt.where(Category.in_subtree(category.tree))
+
+    return stmt
+
+
+# Turn free text into an FTS5 query: every word must match, as a prefix.
+# Words are quoted so user input can never be parsed as FTS5 syntax.
+def build_match_expression(query):
+    terms = ['"' + word.replace('"', '""') + '"*' for word in query.split()]
+    return " ".join(terms)
+
+
+# Escape FTS5 output and turn match markers into <mark> tags
+@bp.app_template_filter("highlight")
+def highlight_filter(value):
+    if value is None:
+        return ""
+
+    return Markup(
+        str(escape(value))
+        .replace(MATCH_START, "<mark>")
+        .replace(MATCH_END, "</mark>")
+    )
+
+
+def search_available():
+    return db.engine.dialect.name == "sqlite"
+
+
+# Create the search index and its triggers if they're missing.
+# A freshly created index is filled from the existing notes.
+def init_search_index():
+    if not search_available():
+        return
+
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'note_fts'")
+    ).scalar()
+
+    for statement in SEARCH_SCHEMA:
+        db.session.execute(text(statement))
+
+    if not exists:
+        rebuild_search_index()
+
+    db.session.commit()
+
+
+def rebuild_search_index():
+    db.session.execute(text("INSERT INTO note_fts(note_fts) VALUES ('rebuild')"))
+
+
+# Rebuild the search index from the note table
+@bp.cli.command("rebuild")
+def rebuild_command():
+    if not search_available():
+        raise click.ClickException("Search requires SQLite with FTS5.")
+
+    init_search_index()
+    rebuild_search_index()
+    db.session.commit()
+    click.echo("Search index rebuilt.")
@@ -0,0 +1,275 @@
+import bisect
+import re
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import func
+
+from faqapp.extensions import db
+from faqapp.models import Category, Note
+from faqapp.versions import (
+    CATEGORY_VERSION,
+    NOTE_VERSION,
+    committed_versions,
+    get_versions,
+)
+
+# Word starts in a title, each one is a key of the index
+WORD_START = re.compile(r"(?:^|(?<=\s))\S")
+
+# Version counters of the indexed titles
+INDEX_VERSIONS = (NOTE_VERSION, CATEGORY_VERSION)
+
+
+def normalize(text):
+    return " ".join(text.casefold().split())
+
+
+# Keys for a title: the title itself and the rest of it from every later word,
+# so "Reset the printer" is found by "res", "the pr" and "printer"
+def title_keys(title):
+    title = normalize(title)
+    return {title[match.start() :] for match in WORD_START.finditer(title)}
+
+
+# Per-process prefix index of note titles and category names.
+# Keys are kept in one sorted list of (key, kind, id) tuples, a lookup is a
+# bisect to the first key starting with the prefix and a scan from there.
+# Writes in this process update the index as they happen, changes made by
+# other workers are picked up by a rebuild once the note or category version
+# moved on, checked at most every TYPEAHEAD_REFRESH_INTERVAL seconds.
+# An index that would hold more than max_entries keys isn't kept at all,
+# lookups then go to the database until a rebuild finds it fits again.
+class TypeaheadIndex:
+    def __init__(self, max_entries, refresh_interval):
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self.entries = []
+        self.titles = {}
+        self.ready = False
+        self.too_large = False
+        self.versions = None
+        self.checked_at = 0.0
+        self.building = False
+        self.lock = threading.Lock()
+
+    def lookup(self, prefix, limit):
+        prefix = normalize(prefix)
+        results = []
+        seen = set()
+
+        with self.lock:
+            position = bisect.bisect_left(self.entries, (prefix,))
+            while position < len(self.entries) and len(results) < limit:
+                key, kind, item_id = self.entries[position]
+                if not key.startswith(prefix):
+                    break
+                if (kind, item_id) not in seen:
+                    seen.add((kind, item_id))
+                    results.append((kind, item_id, self.titles[kind, item_id]))
+                position += 1
+
+        return results
+
+    # Add or rename a note or category, right after the change was committed
+    def set(self, kind, item_id, title):
+        bumps = committed_versions()
+        with self.lock:
+            if not self.ready:
+                return
+            self._advance(bumps)
+            self._remove(kind, item_id)
+            for key in title_keys(title):
+                bisect.insort(self.entries, (key, kind, item_id))
+            self.titles[kind, item_id] = title
+
+            if len(self.entries) > self.max_entries:
+                self._drop()
+
+    def remove(self, kind, item_ids):
+        bumps = committed_versions()
+        with self.lock:
+            if not self.ready:
+                return
+            self._advance(bumps)
+            for item_id in item_ids:
+                self._remove(kind, item_id)
+
+    # Rebuild on the next lookup, for bulk changes that aren't worth tracking
+    def expire(self):
+        with self.lock:
+            self.checked_at = 0.0
+            self.versions = None
+
+    # Count the change being applied as seen, so it doesn't cause a rebuild.
+    # Versions that were moved on by other processes too are left behind.
+    def _advance(self, bumps):
+        if self.versions is None:
+            return
+        self.versions = tuple(
+            bumps[name][1] if name in bumps and version == bumps[name][0] else version
+            for name, version in zip(INDEX_VERSIONS, self.versions)
+        )
+
+    def _remove(self, kind, item_id):
+        title = self.titles.pop((kind, item_id), None)
+        if title is None:
+            return
+        for key in title_keys(title):
+            position = bisect.bisect_left(self.entries, (key, kind, item_id))
+            if position < len(self.entries) and self.entries[position] == (
+                key,
+                kind,
+                item_id,
+            ):
+                del self.entries[position]
+
+    def _drop(self):
+        self.entries = []
+        self.titles = {}
+        self.ready = False
+        self.too_large = True
+
+    # Whether it's time to compare the index with the database
+    def due(self):
+        with self.lock:
+            if self.building:
+                return False
+            return time.monotonic() - self.checked_at >= self.refresh_interval
+
+    # Load all titles and names, unless the stored versions show nothing changed.
+    # Runs in a background thread, lookups meanwhile use the old index or the database.
+    def refresh(self):
+        with self.lock:
+            if self.building:
+                return
+            self.building = True
+            self.checked_at = time.monotonic()
+
+        try:
+            versions = get_versions(*INDEX_VERSIONS)
+            if versions == self.versions:
+                return
+
+            # Every title has at least one key, no need to load them all
+            # to find out there are too many
+            count = db.session.execute(
+                db.select(
+                    db.select(func.count()).select_from(Note).scalar_subquery()
+                    + db.select(func.count()).select_from(Category).scalar_subquery()
+                )
+            ).scalar()
+            if count > self.max_entries:
+                self._give_up(versions, count)
+                return
+
+            titles = {}
+            for kind, query in (
+                ("category", db.select(Category.id, Category.name)),
+                ("note", db.select(Note.id, Note.title)),
+            ):
+                for item_id, title in db.session.execute(query):
+                    titles[kind, item_id] = title
+
+            entries = [
+                (key, kind, item_id)
+                for (kind, item_id), title in titles.items()
+                for key in title_keys(title)
+            ]
+
+            if len(entries) > self.max_entries:
+                self._give_up(versions, len(entries))
+                return
+
+            entries.sort()
+            with self.lock:
+                self.entries = entries
+                self.titles = titles
+                self.versions = versions
+                self.ready = True
+                self.too_large = False
+        finally:
+            db.session.remove()
+            with self.lock:
+                self.building = False
+
+    # Too many keys at these versions, look again once they change
+    def _give_up(self, versions, count):
+        with self.lock:
+            if not self.too_large:
+                current_app.logger.warning(
+                    "Typeahead index needs %s entries, more than "
+                    "TYPEAHEAD_MAX_ENTRIES, using database lookups",
+                    count,
+                )
+            self._drop()
+            self.versions = versions
+
+
+def get_typeahead_index():
+    return current_app.extensions["faqapp.typeahead"]
+
+
+# Start a background refresh of the index when it's due
+def refresh_in_background(index):
+    if not index.due():
+        return
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                index.refresh()
+            except Exception:
+                app.logger.exception("Building the typeahead index failed")
+
+    threading.Thread(target=run, name="faqapp-typeahead", daemon=True).start()
+
+
+# Note titles and category names matching prefix, as (kind, id, title) tuples.
+# Answered from memory once the index is built, until then from the database.
+def suggest(prefix, limit):
+    index = get_typeahead_index()
+    refresh_in_background(index)
+
+    if index.ready:
+        return index.lookup(prefix, limit)
+    return suggest_from_database(prefix, limit)
+
+
+def suggest_from_database(prefix, limit):
+    prefix = normalize(prefix)
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+    results = []
+    for kind, column, id_column in (
+        ("category", Category.name, Category.id),
+        ("note", Note.title, Note.id),
+    ):
+        rows = db.session.execute(
+            db.select(id_column, column)
+            .where(
+                column.ilike(escaped + "%", escape="\\")
+                | column.ilike("% " + escaped + "%", escape="\\")
+            )
+            .order_by(column)
+            .limit(limit - len(results))
+        ).all()
+        results += [(kind, row[0], row[1]) for row in rows]
+        if len(results) >= limit:
+            break
+
+    return results
+
+
+def init_typeahead(app, build=True):
+    index = TypeaheadIndex(
+        app.config["TYPEAHEAD_MAX_ENTRIES"], app.config["TYPEAHEAD_REFRESH_INTERVAL"]
+    )
+    app.extensions["faqapp.typeahead"] = index
+
+    if build:
+        with app.app_context():
+            refresh_in_background(index)
@@ -1,9 +1,19 @@
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 from flask import abort, Blueprint, flash, g, redirect, render_template, request, url_for
+from sqlalchemy import func
 from werkzeug.security import generate_password_hash
 
 from faqapp.auth import login_required, level_required
+from faqapp.counts import adjust_note_counts
 from faqapp.extensions import db
-from faqapp.models import User, Note
+from faqapp.models import User, Note, NoteRevision
+from faqapp.principals import invalidate_principals
+from faqapp.typeahead import get_typeahead_index
+from faqapp.versions import NOTE_VERSION, bump_version
 
 
 bp = Blueprint("users", __name__, url_prefix="/users")
@@ -40,6 +50,7 @@ def edit_user(id):
             user.permission_level = permission
             if password:
                 user.hash=generate_password_hash(password)
+            invalidate_principals()
             db.session.commit()
             return redirect(url_for("users.manage_users"))
             
@@ -55,7 +66,7 @@ def delete_user(id):
     user = get_user(id)
     
     # Stop user from deleting himself
-    if user == g.user:
+    if user.id == g.user.id:
         flash(f"Cannot delete yourself. Please use another admin user if you need to delete user '{user.name}'")
         return redirect(url_for("users.manage_users"))  
     
@@ -74,14 +85,10 @@ def delete_user(id):
 
 
         if error is None:
-            notes = db.session.execute(db.select(Note).where(Note.author_id == user.id)).scalars()
-            if notes is not None:
-                for note in notes:
-                    note.author_id = admin.id
-                    db.session.commit()
-                    
-            db.session.delete(user)
+            remove_users([user.id], keep_notes, admin.id)
+            invalidate_principals()
             db.session.commit()
+            get_typeahead_index().expire()
             return redirect(url_for("users.manage_users"))
     
         flash(error)
@@ -89,6 +96,213 @@ def delete_user(id):
     return render_template("users/delete.html", user=user, admin=admin)
 
 
+# Batch user administration: create, re-level or delete many users at once
+@bp.route("/batch", methods=("GET", "POST"))
+@login_required
+@level_required(4)
+def batch_users():
+    if request.method == "POST":
+        rows, error = read_batch_rows()
+
+        if error is None:
+            errors = apply_batch(rows)
+            if not errors:
+                db.session.commit()
+                get_typeahead_index().expire()
+                return redirect(url_for("users.manage_users"))
+
+            db.session.rollback()
+            for error in errors:
+                flash(error)
+        else:
+            flash(error)
+
+    return render_template("users/batch.html")
+
+
+# Read batch rows from a JSON body or an uploaded CSV / JSON file
+def read_batch_rows():
+    if request.is_json:
+        rows = request.get_json(silent=True)
+    else:
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            return None, "Please choose a CSV or JSON file."
+
+        try:
+            if upload.filename.lower().endswith(".json"):
+                rows = json.load(upload.stream)
+            else:
+                rows = list(csv.DictReader(io.TextIOWrapper(upload.stream, "utf-8-sig")))
+        except (ValueError, csv.Error):
+            return None, "Could not read the uploaded file."
+
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return None, "Expected a list of users."
+    if not rows:
+        return None, "The file contains no users."
+
+    return rows, None
+
+
+# Validate every row first, then apply each action as bulk statements.
+# Returns a list of errors, nothing is changed if there are any.
+def apply_batch(rows):
+    errors = []
+    creates = []
+    levels = {}
+    deletes = {"keep": [], "delete": []}
+
+    names = [str(row.get("name") or "").strip() for row in rows]
+    existing = {
+        user.name: user
+        for user in db.session.execute(
+            db.select(User).where(User.name.in_(names))
+        ).scalars()
+    }
+    seen = set()
+
+    for line, (row, name) in enumerate(zip(rows, names), start=1):
+        action = str(row.get("action") or "").strip().lower()
+        user = existing.get(name)
+
+        if not name:
+            errors.append(f"Row {line}: username is required.")
+            continue
+        if name in seen:
+            errors.append(f"Row {line}: user {name} appears more than once.")
+            continue
+        seen.add(name)
+
+        if action in ("create", "level"):
+            # New users start at level 1, a level change has to name the level
+            level = row.get("permission_level")
+            level = "" if level is None else str(level).strip()
+            if not level and action == "level":
+                errors.append(f"Row {line}: permission level is required.")
+                continue
+            try:
+                level = int(level or 1)
+            except ValueError:
+                level = None
+            if level not in range(1, 5):
+                errors.append(f"Row {line}: permission level must be 1-4.")
+                continue
+
+        if action == "create":
+            if user is not None:
+                errors.append(f"Row {line}: user {name} is already registered.")
+            elif not row.get("password"):
+                errors.append(f"Row {line}: password is required.")
+            else:
+                creates.append((name, str(row["password"]), level))
+        elif action in ("level", "delete"):
+            if user is None:
+                errors.append(f"Row {line}: user {name} doesn't exist.")
+            elif user.id == g.user.id:
+                errors.append(f"Row {line}: cannot change your own account.")
+            elif action == "level":
+                levels.setdefault(level, []).append(user.id)
+            else:
+                keep_notes = str(row.get("notes") or "keep").strip().lower()
+                if keep_notes not in deletes:
+                    errors.append(f"Row {line}: unknown command {keep_notes}")
+                else:
+                    deletes[keep_notes].append(user.id)
+        else:
+            errors.append(f"Row {line}: unknown action {action}")
+
+    if errors:
+        return errors
+
+    # Hashing dominates the cost of creating users, so spread it over threads
+    if creates:
+        with ThreadPoolExecutor() as executor:
+            hashes = executor.map(
+                generate_password_hash, [password for _, password, _ in creates]
+            )
+            db.session.execute(
+                db.insert(User),
+                [
+                    {"name": name, "hash": pw_hash, "permission_level": level}
+                    for (name, _, level), pw_hash in zip(creates, hashes)
+                ],
+            )
+
+    if levels or deletes["keep"] or deletes["delete"]:
+        invalidate_principals()
+
+    for level, user_ids in levels.items():
+        db.session.execute(
+            db.update(User)
+            .where(User.id.in_(user_ids))
+            .values(permission_level=level),
+            execution_options={"synchronize_session": False},
+        )
+
+    # Notes that are kept go to the first admin left after this batch
+    deleted_ids = deletes["keep"] + deletes["delete"]
+    if deleted_ids:
+        admin = db.session.execute(
+            db.select(User.id)
+            .where(User.permission_level == 4)
+            .where(User.id.not_in(deleted_ids))
+            .order_by(User.id)
+        ).scalar()
+
+        for keep_notes, user_ids in deletes.items():
+            if user_ids:
+                remove_users(user_ids, keep_notes, admin)
+
+    flash(
+        f"Created {len(creates)} users, "
+        f"changed level of {sum(map(len, levels.values()))}, "
+        f"deleted {len(deleted_ids)}."
+    )
+    return []
+
+
+# Delete users, moving their notes to another admin or deleting them.
+# Runs as set-based statements, the caller commits.
+def remove_users(user_ids, keep_notes, admin_id):
+    if keep_notes == "keep":
+        notes_query = db.update(Note).values(author_id=admin_id)
+    else:
+        notes_query = db.delete(Note)
+
+        # Deleted notes come off their categories' counts
+        adjust_note_counts(
+            dict(
+                db.session.execute(
+                    db.select(Note.category, (-func.count()).label("removed"))
+                    .where(Note.author_id.in_(user_ids))
+                    .group_by(Note.category)
+                ).all()
+            )
+        )
+
+    notes_count = db.session.execute(
+        notes_query.where(Note.author_id.in_(user_ids)),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+    # Revisions they made to other notes stay, shown as by a deleted user
+    db.session.execute(
+        db.update(NoteRevision)
+        .where(NoteRevision.author_id.in_(user_ids))
+        .values(author_id=None),
+        execution_options={"synchronize_session": False},
+    )
+
+    db.session.execute(
+        db.delete(User).where(User.id.in_(user_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    bump_version(NOTE_VERSION)
+
+    return notes_count
+
+
 # Get user by ID
 def get_user(id):
     user = db.session.execute(db.select(User).where(User.id == id)).scalar()
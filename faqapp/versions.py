@@ -0,0 +1,65 @@
+from faqapp.extensions import db
+from faqapp.models import Counter
+
+# Names of the version counters kept in the counter table
+CATEGORY_VERSION = "category"
+NOTE_VERSION = "note"
+SCHEMA_VERSION = "schema"
+USER_VERSION = "user"
+
+
+# Read the current value of a version counter
+def get_version(name):
+    value = db.session.execute(
+        db.select(Counter.value).where(Counter.name == name)
+    ).scalar()
+
+    return value or 0
+
+
+# Read several version counters with one query, in the order given
+def get_versions(*names):
+    values = dict(
+        db.session.execute(
+            db.select(Counter.name, Counter.value).where(Counter.name.in_(names))
+        ).all()
+    )
+
+    return tuple(values.get(name, 0) for name in names)
+
+
+# Increment a version counter as part of the current transaction.
+# Callers commit together with the change the version describes.
+# The values before and after the transaction are kept for committed_versions.
+def bump_version(name):
+    value = db.session.execute(
+        db.update(Counter)
+        .where(Counter.name == name)
+        .values(value=Counter.value + 1)
+        .returning(Counter.value)
+    ).scalar()
+
+    if value is None:
+        db.session.add(Counter(name=name, value=1))
+        value = 1
+
+    bumps = db.session.info.setdefault("version_bumps", {})
+    before = bumps[name][0] if name in bumps else value - 1
+    bumps[name] = (before, value)
+
+
+# Counters moved by the session's last commit, as name -> (before, after).
+# A cache that was at "before" and applied the change itself can move to
+# "after" without missing a change made by another process.
+def committed_versions():
+    return db.session.info.get("committed_versions", {})
+
+
+# Store an explicit value in a version counter, the caller commits
+def set_version(name, value):
+    result = db.session.execute(
+        db.update(Counter).where(Counter.name == name).values(value=value)
+    )
+
+    if result.rowcount == 0:
+        db.session.add(Counter(name=name, value=value))